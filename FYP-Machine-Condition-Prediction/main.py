@@ -39,6 +39,16 @@ def get_inference_status():
         "message": "Inference running directly from InfluxDB data"
     }
 
+@app.get("/models/registry")
+def get_model_registry_stats():
+    
+    return {
+        "status": "success",
+        "model_mode": streamer.inference_service.model_mode,
+        "registry": streamer.inference_service.registry.stats(),
+        "hot_reload": streamer.inference_service.reload_stats
+    }
+
 @app.get("/predict/{workspace_id}")
 def get_latest_predictions(workspace_id: str):
     
@@ -69,6 +79,7 @@ def start_background_stream():
     thread = threading.Thread(target=streamer.start_stream, daemon=True)
     thread.start()
     print("[Main] Inference engine started - monitoring InfluxDB every 60 seconds")
+    streamer.inference_service.start_hot_reload()
 
 @app.get("/", response_class=HTMLResponse)
 def root():
@@ -116,6 +127,7 @@ def api_info():
             "/": "Interactive dashboard",
             "/workspaces": "List workspaces with trained models",
             "/inference/status": "Get inference engine status",
+            "/models/registry": "Model cache size, hits/misses, evictions, load times and hot reloads",
             "/predict/{workspace_id}": "Get predictions for specific workspace",
             "/docs": "Interactive API documentation"
         }
@@ -5,10 +5,40 @@ import pandas as pd
 import torch
 import pickle
 import os
-import glob
+import copy
+import time
+import threading
+from contextlib import nullcontext
 from datetime import datetime
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
+from services.model_runtime import RuntimeModel, has_runtime_artifacts
+from services.model_registry import ModelRegistry, load_manifest, scan_model_dirs, MANIFEST_FILE, VERSION_FORMAT
+
+
+FEATURE_NAMES = ['current', 'accX', 'accY', 'accZ', 'tempA', 'tempB']
+
+# Global mode serves every workspace from one shared model (model_global_* / scaler_global_*.pkl)
+GLOBAL_MODEL_ID = "global"
+WORKSPACE_EMBEDDING_FILE = "workspace_embedding.pt"
+
+# Config fields that change the forward pass without changing parameter shapes
+SHAPE_CONFIG_FIELDS = ['context_length', 'prediction_length', 'patch_length', 'patch_stride',
+                       'num_input_channels', 'num_targets', 'scaling', 'norm_type']
+
+# MODEL_BACKEND: "auto" serves the exported runtime artifacts (model_dir/runtime/) when a model has them
+# and falls back to transformers; "onnx" / "torchscript" pick the runtime; "transformers" always loads HF.
+# With several per-workspace models, auto loads HF instead: their weights stack, so a fleet cycle is one
+# vmap pass, while each exported model is opaque and would cost a forward pass per workspace
+MODEL_BACKENDS = ("auto", "onnx", "torchscript", "transformers")
+# MODEL_QUANTIZED=1 serves a model's int8 trace when training exported one (it passed the accuracy gate)
+
+# Per-workspace models are loaded on first use; beyond these budgets the least recently used are evicted (0 = no limit)
+MODEL_CACHE_MAX_MODELS = int(os.getenv("MODEL_CACHE_MAX_MODELS", "0"))
+MODEL_CACHE_MAX_MB = float(os.getenv("MODEL_CACHE_MAX_MB", "0"))
+
+# Seconds between checks for changed model artifacts by the hot-reload thread (0 = off)
+MODEL_RELOAD_SECONDS = float(os.getenv("MODEL_RELOAD_SECONDS", "60"))
 
 
 class InferenceService:
@@ -23,11 +53,38 @@ class InferenceService:
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
         
-        self.models = {}  # {workspace_id: model}
+        self.models = {}  # {workspace_id: model}, global mode only; per-workspace models live in self.registry
         self.scalers = {}  # {workspace_id: scaler}
         self.model_timestamps = {}  # {workspace_id: timestamp}
         self.latest_predictions = {}  # {workspace_id: {"forecast": array, "timestamp": datetime}}
-        
+        self._stacked_groups = {}  # {group_key: (base_model, params, buffers)} for batched forward
+        self._unbatchable_groups = set()  # group keys where vmap over stacked weights failed
+        
+        # MODEL_MODE=global: one shared model; per-workspace scalers and input offsets
+        self.model_mode = os.getenv("MODEL_MODE", "per_workspace")
+        self.global_model = None
+        self._global_model_dir = None
+        self.workspace_offsets = {}  # {workspace_id: (6,) offset added to the scaled input}
+        self.unseen_offset = np.zeros(len(FEATURE_NAMES))
+        self._online_scalers = set()  # workspaces new to the global model, scaled by a running min/max
+        
+        self.model_backend = os.getenv("MODEL_BACKEND", "auto")
+        if self.model_backend not in MODEL_BACKENDS:
+            print(f"[InferenceService] WARNING: Unknown MODEL_BACKEND {self.model_backend}, using auto")
+            self.model_backend = "auto"
+        self.model_quantized = os.getenv("MODEL_QUANTIZED", "0") == "1"
+        
+        self.registry = ModelRegistry(self._load_registry_entry,
+                                      max_models=MODEL_CACHE_MAX_MODELS or None,
+                                      max_memory_mb=MODEL_CACHE_MAX_MB or None,
+                                      on_evict=self._forget_stacked)
+        
+        # Hot reload: changed models are loaded and warmed up off the inference path, then swapped in
+        self._swap_lock = threading.Lock()  # global mode: serving state is read and replaced as one unit
+        self._artifact_signature = None
+        self._failed_reloads = {}  # {workspace_id: artifact fingerprint} replacements that failed to load or warm up
+        self._reload_thread = None
+        self.reload_stats = {"checks": 0, "swapped": 0, "deferred": 0, "removed": 0, "failed": 0, "last_change": None}
     
         self._load_all_workspace_models()
         
@@ -40,148 +97,467 @@ class InferenceService:
     
     def _load_all_workspace_models(self):
         
-        from transformers import PatchTSTForPrediction
-        
-        # Find all model directories
-        model_pattern = os. path.join(self.base_dir, "model_*_*")
-        all_model_dirs = glob.glob(model_pattern)
+        # Stacked weights reference the previous model objects
+        self._stacked_groups = {}
+        self._artifact_signature = self._current_signature()
         
-        if not all_model_dirs:
-            print("[InferenceService] WARNING: No trained models found in", self.base_dir)
+        if self.model_mode == "global":
+            self._load_global_model()
             return
         
-        # Group by workspace
-        workspace_models = {}
-        for model_dir in all_model_dirs:
-            
-            dir_name = os.path.basename(model_dir)
-            
+        self.registry.set_index(self._build_index())
+        print(f"[InferenceService] Indexed {len(self.registry.index)} workspace model(s); each loads on first use")
+    
+    def _build_index(self):
+        """{workspace_id: active model entry} for per-workspace serving"""
+        index = {}
+        for workspace_id, entry in self._resolve_models().items():
+            # The shared model is only served in global mode
+            if workspace_id == GLOBAL_MODEL_ID:
+                continue
             
-            name_parts = dir_name.replace('model_', '')
+            # Exported models carry their scaler in runtime.json
+            if entry["scaler_path"] is None and not has_runtime_artifacts(entry["model_dir"]):
+                print(f"[InferenceService] WARNING: No scaler found for {workspace_id}")
+                continue
             
+            index[workspace_id] = entry
+            self.model_timestamps[workspace_id] = datetime.strptime(entry["version"], VERSION_FORMAT).timestamp()
+        return index
+    
+    def _resolve_models(self):
+        """{workspace_id: active model entry}: the manifest's active versions, plus a directory scan for
+        workspaces it does not list (models saved before the manifest existed, or copied in by hand)"""
+        resolved = load_manifest(self.base_dir)
+        if resolved is not None:
+            unlisted = {w: e for w, e in scan_model_dirs(self.base_dir).items() if w not in resolved}
+            print(f"[InferenceService] Resolved {len(resolved)} active model(s) from the registry manifest"
+                  + (f", {len(unlisted)} more by directory scan" if unlisted else ""))
+            return {**unlisted, **resolved}
+        
+        resolved = scan_model_dirs(self.base_dir)
+        if not resolved:
+            print("[InferenceService] WARNING: No trained models found in", self.base_dir)
+        else:
+            print(f"[InferenceService] No registry manifest; discovered {len(resolved)} workspace(s) by directory scan")
+        return resolved
+    
+    def _load_registry_entry(self, workspace_id, entry):
+        """(model, scaler) for an index entry, called by the registry on a miss"""
+        model = self._load_model(entry["model_dir"])
+        
+        # Exported models carry their scaler; otherwise use the pickled one
+        scaler = model.scalers().get(workspace_id) if isinstance(model, RuntimeModel) else None
+        if scaler is None:
+            if entry["scaler_path"] is None:
+                raise Exception("No scaler found")
+            with open(entry["scaler_path"], "rb") as f:
+                scaler = pickle.load(f)
+        
+        print(f"[InferenceService] Loaded model for workspace: {workspace_id}")
+        print(f"                    Model: {os.path.basename(entry['model_dir'])} ({self._backend_name(model)})")
+        return model, scaler
+    
+    def _forget_stacked(self, workspace_id):
+        
+        # Stacked weights are keyed by model ids, which an evicted model's successor may reuse
+        self._stacked_groups = {}
+    
+    def _load_model(self, model_dir):
+        """Exported runtime model when MODEL_BACKEND allows and the artifacts exist, else the HF model"""
+        if self._serves_runtime() and has_runtime_artifacts(model_dir):
+            try:
+                return RuntimeModel(model_dir, backend=self.model_backend, quantized=self.model_quantized)
+            except Exception as e:
+                print(f"[InferenceService] Runtime backend unavailable for {os.path.basename(model_dir)}, "
+                      f"loading with transformers: {e}")
+        
+        from transformers import PatchTSTForPrediction
+        
+        try:
+            model = PatchTSTForPrediction.from_pretrained(model_dir)
+        except:
             
-            parts = name_parts.split('_')
-            if len(parts) >= 3:
-                
-                workspace_id = '_'.join(parts[:-2])
+            pt_file = os.path.join(model_dir, "pytorch_model.bin")
+            if os.path.exists(pt_file):
+                model = torch.load(pt_file, map_location=self.device, weights_only=False)
             else:
-                
-                workspace_id = name_parts
-            
-            if workspace_id not in workspace_models:
-                workspace_models[workspace_id] = []
-            workspace_models[workspace_id].append(model_dir)
+                raise Exception("No valid model file found")
         
+        model.to(self.device)
+        model.eval()
+        return model
+    
+    def _serves_runtime(self):
+        """False where batching beats the faster single-model runtime (see MODEL_BACKEND)"""
+        if self.model_backend == "transformers":
+            return False
+        if self.model_backend != "auto" or self.model_mode == "global":
+            return True
+        return len(self.registry.index) <= 1
+    
+    def _backend_name(self, model):
         
-        print(f"[InferenceService] Discovered {len(workspace_models)} workspace(s)")
+        return model.backend if isinstance(model, RuntimeModel) else "transformers"
+    
+    def _load_global_model(self, entry=None):
+        """Load the active global model and swap it in with its scalers and offsets once it passes a warm-up"""
+        entry = entry or self._resolve_models().get(GLOBAL_MODEL_ID)
+        if entry is None:
+            print("[InferenceService] WARNING: No global model found in", self.base_dir)
+            return
+        
+        latest_model_dir = entry["model_dir"]
+        scaler_path = entry["scaler_path"]
         
-        for workspace_id, model_dirs in workspace_models.items():
+        try:
+            model = self._load_model(latest_model_dir)
+            
+            # {workspace_id: scaler} for the workspaces the model was trained on
+            scalers = model.scalers() if isinstance(model, RuntimeModel) else {}
+            if not scalers and scaler_path:
+                with open(scaler_path, "rb") as f:
+                    scalers = pickle.load(f)
+            
+            # Learned input offsets; row 0 is the offset for workspaces the model never saw
+            offsets = {}
+            unseen_offset = np.zeros(len(FEATURE_NAMES))
+            embedding_path = os.path.join(latest_model_dir, WORKSPACE_EMBEDDING_FILE)
+            if os.path.exists(embedding_path):
+                embedding = torch.load(embedding_path, map_location="cpu")
+                weight = embedding["weight"].numpy().astype(np.float64)
+                unseen_offset = weight[0]
+                offsets = {workspace_id: weight[i + 1] for i, workspace_id in enumerate(embedding["workspace_ids"])}
+            
+            self._warm_up(model)
+        except Exception as e:
+            print(f"[InferenceService] Failed to load global model: {e}")
+            return False
+        
+        trained_at = datetime.strptime(entry["version"], VERSION_FORMAT).timestamp()
+        with self._swap_lock:
+            self.global_model = model
+            self._global_model_dir = latest_model_dir
+            self.models = {workspace_id: model for workspace_id in scalers}
+            self.scalers = dict(scalers)
+            self.model_timestamps = {workspace_id: trained_at for workspace_id in scalers}
+            self.workspace_offsets = offsets
+            self.unseen_offset = unseen_offset
+            self._online_scalers = set()
+        
+        print(f"[InferenceService] Loaded global model: {os.path.basename(latest_model_dir)} ({self._backend_name(model)})")
+        print(f"                    Trained on {len(scalers)} workspace(s); new workspaces are served on first sight")
+        return True
+
+    def _warm_up(self, model):
+        """One forward pass on a zero window; raises unless the model returns a finite forecast of the right shape"""
+        window = torch.zeros(1, self._context_length(model), len(FEATURE_NAMES), device=self.device)
+        with torch.no_grad():
+            forecast = model(past_values=window).prediction_outputs
+        if forecast.shape[0] != 1 or forecast.shape[-1] != len(FEATURE_NAMES) or not torch.isfinite(forecast).all():
+            raise ValueError(f"warm-up forecast has shape {tuple(forecast.shape)} or non-finite values")
+
+    def has_model(self, workspace_id):
+        """True if the workspace can be forecast; the global model takes on new workspaces as they appear"""
+        if self.model_mode != "global":
+            return workspace_id in self.registry
+        if workspace_id not in self.models and self.global_model is not None:
+            self.models[workspace_id] = self.global_model
+            print(f"[InferenceService] Serving new workspace {workspace_id} with the global model")
+        return workspace_id in self.models
+
+    def _model_for(self, workspace_id):
+        """(model, scaler) for the workspace, loaded through the registry in per-workspace mode
+        
+        The pair comes from one registry entry, so a hot swap never mixes an old model with a new scaler.
+        In global mode the scaler is None and is looked up by _scaler_for, and a workspace new to
+        the global model gets the global model. (None, None) if unavailable.
+        """
+        if self.model_mode == "global":
+            return self.models.get(workspace_id, self.global_model), None
+        return self.registry.get(workspace_id) or (None, None)
+
+    def _serving_lock(self):
+        """The global-mode swap lock; per-workspace lookups are already atomic in the registry,
+        and taking it there would queue every inference call behind a cold model load"""
+        return self._swap_lock if self.model_mode == "global" else nullcontext()
+
+    def start_hot_reload(self, interval_seconds=MODEL_RELOAD_SECONDS):
+        """Watch for changed model artifacts on a background thread; changed models go live without pausing inference"""
+        if interval_seconds <= 0 or self._reload_thread is not None:
+            return
+        self._reload_thread = threading.Thread(target=self._hot_reload_loop, args=(interval_seconds,),
+                                               name="model-hot-reload", daemon=True)
+        self._reload_thread.start()
+        print(f"[InferenceService] Hot reload: checking for changed models every {interval_seconds:g}s")
+
+    def _hot_reload_loop(self, interval_seconds):
+        """Apply each artifact change; the signature is only recorded once every replacement went live,
+        so a failed reload (e.g. a model directory still being copied) is retried on the next check"""
+        while True:
+            time.sleep(interval_seconds)
             try:
-                
-                latest_model_dir = max(model_dirs, key=os.path.getctime)
-                
-               
-                scaler_pattern = os.path.join(self.base_dir, f"scaler_{workspace_id}_*.pkl")
-                scaler_files = glob.glob(scaler_pattern)
-                
-                if not scaler_files:
-                    print(f"[InferenceService] WARNING: No scaler found for {workspace_id}")
-                    continue
-                
-                latest_scaler = max(scaler_files, key=os.path.getctime)
-                
-                
-                with open(latest_scaler, "rb") as f:
-                    scaler = pickle.load(f)
-                
+                self.reload_stats["checks"] += 1
+                signature = self._current_signature()
+                if signature != self._artifact_signature and self.reload_workspace_models():
+                    self._artifact_signature = signature
+            except Exception as e:
+                print(f"[InferenceService] Hot reload check failed: {e}")
+
+    def _current_signature(self):
+        """Changes when the manifest is rewritten or model directories are added or removed"""
+        if not os.path.isdir(self.base_dir):
+            return None
+        manifest_path = os.path.join(self.base_dir, MANIFEST_FILE)
+        manifest_mtime = os.stat(manifest_path).st_mtime_ns if os.path.exists(manifest_path) else None
+        return (manifest_mtime, os.stat(self.base_dir).st_mtime_ns)
+
+    def reload_workspace_models(self):
+        """Apply changed model artifacts, touching only the workspaces whose active model changed
+        
+        A loaded workspace gets its replacement loaded and warmed up here, off the inference path,
+        then swapped in atomically; the old model keeps serving if the replacement fails.
+        Workspaces not loaded yet are simply re-pointed and load the new model on first use.
+        Returns False if a replacement is still pending after a failure.
+        """
+        print("[InferenceService] Checking for new/updated workspace models...")
+        
+        if self.model_mode == "global":
+            entry = self._resolve_models().get(GLOBAL_MODEL_ID)
+            if entry is None or entry["model_dir"] == self._global_model_dir:
+                return True
+            if not self._load_global_model(entry):
+                self.reload_stats["failed"] += 1
+                return False
+            self.reload_stats["swapped"] += 1
+            self.reload_stats["last_change"] = datetime.now().isoformat()
+            return True
+        
+        index = self._build_index()
+        current = dict(self.registry.index)
+        complete = True
+        
+        for workspace_id in current:
+            if workspace_id not in index:
+                self.registry.remove(workspace_id)
+                self.reload_stats["removed"] += 1
+        
+        for workspace_id, entry in index.items():
+            artifacts = (entry["model_dir"], entry["scaler_path"])
+            previous = current.get(workspace_id)
+            if previous is not None and (previous["model_dir"], previous["scaler_path"]) == artifacts:
+                continue
             
-                model = None
-                
-                
-                try:
-                    model = PatchTSTForPrediction.from_pretrained(latest_model_dir)
-                except:
-                    
-                    pt_file = os.path.join(latest_model_dir, "pytorch_model.bin")
-                    if os.path.exists(pt_file):
-                        import torch
-                        model = torch.load(pt_file, map_location=self.device, weights_only=False)
-                    else:
-                        raise Exception("No valid model file found")
-                
-                model.to(self.device)
-                model.eval()
-                
+            if not self.registry.is_loaded(workspace_id):
+                self.registry.install(workspace_id, entry)
+                self.reload_stats["deferred"] += 1
+                continue
             
-                self.models[workspace_id] = model
-                self.scalers[workspace_id] = scaler
-                self.model_timestamps[workspace_id] = os.path.getctime(latest_model_dir)
-                
-                print(f"[InferenceService] Loaded model for workspace: {workspace_id}")
-                print(f"                    Model: {os.path.basename(latest_model_dir)}")
-                
+            # A failed replacement is only retried once its files change (e.g. a copy finished)
+            fingerprint = self._artifact_fingerprint(entry)
+            if self._failed_reloads.get(workspace_id) == fingerprint:
+                complete = False
+                continue
+            
+            try:
+                model, scaler = self._load_registry_entry(workspace_id, entry)
+                self._warm_up(model)
             except Exception as e:
-                print(f"[InferenceService] Failed to load model for {workspace_id}: {e}")
+                self._failed_reloads[workspace_id] = fingerprint
+                self.reload_stats["failed"] += 1
+                complete = False
+                print(f"[InferenceService] Keeping the current model for {workspace_id}: replacement failed ({e})")
+                continue
+            
+            self.registry.install(workspace_id, entry, model, scaler)
+            self._failed_reloads.pop(workspace_id, None)
+            self.reload_stats["swapped"] += 1
+            self.reload_stats["last_change"] = datetime.now().isoformat()
+            print(f"[InferenceService] Hot-swapped {workspace_id} to version {entry['version']}")
         
-        print(f"[InferenceService] Total models loaded: {len(self.models)}")
+        return complete
     
-    def reload_workspace_models(self):
-       
-        print("[InferenceService] Checking for new/updated workspace models...")
-        self._load_all_workspace_models()
+    def _artifact_fingerprint(self, entry):
+        """Paths plus the newest file modification time under them"""
+        paths = [entry["scaler_path"]] if entry["scaler_path"] else []
+        for root, _, files in os.walk(entry["model_dir"]):
+            paths.extend(os.path.join(root, name) for name in files)
+        newest = max((os.stat(path).st_mtime_ns for path in paths if os.path.exists(path)), default=None)
+        return entry["model_dir"], entry["scaler_path"], newest
     
     def get_available_workspaces(self):
        
+        if self.model_mode != "global":
+            return self.registry.workspaces()
         return list(self.models.keys())
 
+    def get_context_length(self, workspace_id):
+        
+        return self._context_length(self._model_for(workspace_id)[0])
+
+    def get_validation_length(self, workspace_id):
+        """Rows validate_model needs: a context window plus the horizon it is scored against; None without a model"""
+        model = self._model_for(workspace_id)[0]
+        if model is None:
+            return None
+        return self._context_length(model) + model.config.prediction_length
+
     def run_inference(self, workspace_id, influx_data):
       
-       
-        if workspace_id not in self.models:
-            print(f"[Inference] No model loaded for workspace: {workspace_id}")
-            print(f"[Inference] Available workspaces: {list(self.models.keys())}")
-            return None, {"status": "error", "message": f"No model found for workspace {workspace_id}"}
+        return self.run_batch_inference({workspace_id: influx_data})[workspace_id]
+
+    def run_batch_inference(self, workspace_data):
+        """Forecast several workspaces with one forward pass per group of shape-compatible models.
+        
+        Args:
+            workspace_data: {workspace_id: DataFrame or (N, 6) array of sensor rows, oldest first}
+        
+        Returns:
+            {workspace_id: (forecast, status)} with the same contract as run_inference
+        """
+        results = {}
+        groups = {}  # {group_key: [(workspace_id, model, scaled_window)]}
+        
+        # Model, scaler and offset are read together so a global-model hot swap never lands mid-lookup
+        with self._serving_lock():
+            for workspace_id, influx_data in workspace_data.items():
+                if not self.has_model(workspace_id):
+                    print(f"[Inference] No model loaded for workspace: {workspace_id}")
+                    results[workspace_id] = (None, {"status": "error", "message": f"No model found for workspace {workspace_id}"})
+                    continue
+            
+                model, scaler = self._model_for(workspace_id)
+                if model is None:
+                    results[workspace_id] = (None, {"status": "error", "message": f"Model for workspace {workspace_id} failed to load"})
+                    continue
+            
+                context_length = self._context_length(model)
+                features = self._feature_array(influx_data)
+            
+                if features is None or len(features) < context_length:
+                    got = 0 if features is None else len(features)
+                    print(f"[Inference] Not enough data for {workspace_id} (need {context_length}, got {got}). Skipping inference.")
+                    results[workspace_id] = (None, {"status": "error", "message": f"Need at least {context_length} data points"})
+                    continue
+            
+                # Only the most recent window is fed to the model, so only that slice is scaled
+                scaled_window = self._scaler_for(workspace_id, features, scaler).transform(features[-context_length:])
+                scaled_window = np.clip(scaled_window, 0, 1) + self._workspace_offset(workspace_id)
+            
+                groups.setdefault(self._group_key(model), []).append((workspace_id, model, scaled_window))
         
-        if len(influx_data) < 50:  # Minimum required for reduced model
-            print(f"[Inference] Not enough data for {workspace_id} (need 50, got {len(influx_data)}). Skipping inference.")
-            return None, {"status": "error", "message": "Not enough data for inference."}
+        for group_key, members in groups.items():
+            workspace_ids = [workspace_id for workspace_id, _, _ in members]
+            models = [model for _, model, _ in members]
+            batch = np.stack([window for _, _, window in members]).astype(np.float32)
+            input_tensor = torch.from_numpy(batch).to(self.device)
+            
+            try:
+                forecasts = self._forward_group(group_key, models, input_tensor)
+            except Exception as e:
+                print(f"[Inference] Batched forward failed for {workspace_ids}: {e}")
+                for workspace_id in workspace_ids:
+                    results[workspace_id] = (None, {"status": "error", "message": f"Inference failed: {e}"})
+                continue
+            
+            current_time = datetime.now().isoformat()
+            for workspace_id, forecast in zip(workspace_ids, forecasts):
+                self.latest_predictions[workspace_id] = {
+                    "forecast": forecast.tolist(),  # Convert numpy array to list for JSON serialization
+                    "timestamp": current_time
+                }
+                results[workspace_id] = (forecast, {"status": "success", "message": "Forecast updated"})
+            
+            print(f"[Inference] Forecast {len(workspace_ids)} workspace(s) in one pass: {workspace_ids}")
         
-        print(f"[Inference] Running inference for workspace: {workspace_id} with {len(influx_data)} data points")
+        return results
+
+    def _feature_array(self, influx_data):
         
-        # Get model and scaler for this workspace
-        model = self.models[workspace_id]
-        scaler = self.scalers[workspace_id]
+        if influx_data is None:
+            return None
+        if isinstance(influx_data, pd.DataFrame):
+            return influx_data[FEATURE_NAMES].to_numpy(dtype=np.float64)
+        return np.asarray(influx_data, dtype=np.float64)
+
+    def _scaler_for(self, workspace_id, features, scaler=None):
+        """The workspace's trained scaler; a workspace new to the global model gets a running min/max scaler"""
+        from sklearn.preprocessing import MinMaxScaler
+        
+        if scaler is not None:
+            return scaler
+        scaler = self.scalers.get(workspace_id)
+        if scaler is None:
+            scaler = MinMaxScaler(feature_range=(0, 1))
+            self.scalers[workspace_id] = scaler
+            self._online_scalers.add(workspace_id)
+        if workspace_id in self._online_scalers:
+            scaler.partial_fit(features)
+        return scaler
+
+    def _workspace_offset(self, workspace_id):
         
+        if self.global_model is None:
+            return 0.0
+        return self.workspace_offsets.get(workspace_id, self.unseen_offset)
 
-        raw_data = influx_data[['current', 'accX', 'accY', 'accZ', 'tempA', 'tempB']]
+    def _context_length(self, model):
         
-    
-        scaled_data = scaler.transform(raw_data)
-        scaled_data = np.clip(scaled_data, 0, 1)
+        config = getattr(model, "config", None)
+        return getattr(config, "context_length", 1800)
+
+    def _group_key(self, model):
+        """Models with equal keys have identical parameter shapes and forward behaviour"""
+        # Exported models have no stackable parameters: each is its own group, run as one batched call.
+        # Under MODEL_BACKEND=auto these only reach a fleet cycle when a single workspace is served
+        if isinstance(model, RuntimeModel):
+            return ("RuntimeModel", model.model_dir)
+        
+        config = getattr(model, "config", None)
+        config_key = tuple(str(getattr(config, field, None)) for field in SHAPE_CONFIG_FIELDS)
+        param_key = tuple((name, tuple(t.shape)) for name, t in model.state_dict().items())
+        return (type(model).__name__, config_key, hash(param_key))
+
+    def _forward_group(self, group_key, models, input_tensor):
+        """Run one forward pass for a stacked batch; row i is forecast with models[i]"""
+        with torch.no_grad():
+            # Several workspaces served by the same model object: plain batched call
+            if all(model is models[0] for model in models):
+                outputs = models[0](past_values=input_tensor)
+                return outputs.prediction_outputs.cpu().numpy()
+            
+            if group_key not in self._unbatchable_groups:
+                try:
+                    return self._vmap_forward(group_key, models, input_tensor).cpu().numpy()
+                except Exception as e:
+                    print(f"[Inference] Stacked forward unsupported for this model type, falling back: {e}")
+                    self._unbatchable_groups.add(group_key)
+            
+            forecasts = [model(past_values=input_tensor[i:i + 1]).prediction_outputs[0] for i, model in enumerate(models)]
+            return torch.stack(forecasts).cpu().numpy()
+
+    def _vmap_forward(self, group_key, models, input_tensor):
         
-    
-        context_length = 1800 
-        if len(scaled_data) < context_length:
-            print(f"[Inference] Not enough data after processing (need {context_length}, got {len(scaled_data)})")
-            return None, {"status": "error", "message": f"Need at least {context_length} data points"}
+        from torch.func import functional_call, stack_module_state
         
-        # Take the most recent context_length points
-        model_input = scaled_data[-context_length:].reshape(1, context_length, 6)
-        input_tensor = torch.tensor(model_input, dtype=torch.float32).to(self.device)
+        # Stacked weights are reused across cycles while the group membership is unchanged.
+        # An eviction may replace the cache at any time, so the stack in use is held locally
+        cache_key = (group_key, tuple(id(model) for model in models))
+        stacked = self._stacked_groups.get(cache_key)
+        if stacked is None:
+            params, buffers = stack_module_state(models)
+            stacked = (copy.deepcopy(models[0]).to("meta"), params, buffers)
+            cache = {k: v for k, v in self._stacked_groups.items() if k[0] != group_key}
+            cache[cache_key] = stacked
+            self._stacked_groups = cache
         
-        # Step 4: Feed to model and get forecast
-        with torch.no_grad():
-            outputs = model(past_values=input_tensor)
-            forecast = outputs.prediction_outputs.squeeze().cpu().numpy()
+        base_model, params, buffers = stacked
         
-        # Store the latest predictions with timestamp
-        current_time = datetime.now().isoformat()
-        self.latest_predictions[workspace_id] = {
-            "forecast": forecast.tolist(),  # Convert numpy array to list for JSON serialization
-            "timestamp": current_time
-        }
+        def forward_one(model_params, model_buffers, window):
+            outputs = functional_call(base_model, (model_params, model_buffers), (window.unsqueeze(0),))
+            return outputs.prediction_outputs.squeeze(0)
         
-        return forecast, {"status": "success"}
+        return torch.vmap(forward_one)(params, buffers, input_tensor)
 
     def get_latest_predictions(self, workspace_id):
         
@@ -208,19 +584,22 @@ class InferenceService:
     
     def validate_model(self, workspace_id, influx_data):
       
-        if workspace_id not in self.models:
-            return {"status": "error", "message": f"No model for {workspace_id}"}
-        
-        context_length = 50
-        prediction_length = 10
-        
-        if len(influx_data) < context_length + prediction_length:
-            return {"status": "error", "message": f"Need at least {context_length + prediction_length} data points"}
-        
-        model = self.models[workspace_id]
-        scaler = self.scalers[workspace_id]
         feature_names = ['current', 'accX', 'accY', 'accZ', 'tempA', 'tempB']
         
+        # One lookup: the window lengths, scaler and offset all belong to the model being validated
+        with self._serving_lock():
+            model, scaler = self._model_for(workspace_id)
+            if model is None:
+                return {"status": "error", "message": f"No model for {workspace_id}"}
+            
+            context_length = self._context_length(model)
+            prediction_length = model.config.prediction_length
+            if len(influx_data) < context_length + prediction_length:
+                return {"status": "error", "message": f"Need at least {context_length + prediction_length} data points"}
+            
+            scaler = self._scaler_for(workspace_id, influx_data[feature_names].values, scaler)
+            offset = self._workspace_offset(workspace_id)
+        
        
         context_data = influx_data[-(context_length + prediction_length):-prediction_length]
         actual_future = influx_data[-prediction_length:]
@@ -228,14 +607,14 @@ class InferenceService:
         
         raw_context = context_data[feature_names].values
         scaled_context = scaler.transform(raw_context)
-        scaled_context = np.clip(scaled_context, 0, 1)
+        scaled_context = np.clip(scaled_context, 0, 1) + offset
         
        
-        input_tensor = torch.tensor(scaled_context.reshape(1, context_length, 6), dtype=torch.float32).to(self.device)
+        input_tensor = torch.tensor(scaled_context.reshape(1, context_length, len(feature_names)), dtype=torch.float32).to(self.device)
         
         with torch.no_grad():
             outputs = model(past_values=input_tensor)
-            predictions = outputs.prediction_outputs.squeeze().cpu().numpy()
+            predictions = outputs.prediction_outputs[0].cpu().numpy()
         
        
         actual_scaled = scaler.transform(actual_future[feature_names].values)
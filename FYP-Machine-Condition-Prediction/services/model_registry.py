@@ -0,0 +1,229 @@
+# services/model_registry.py
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+import torch
+
+
+# Written by spark-apps/model_manifest.py: every saved version per workspace and the active one
+MANIFEST_FILE = "registry.json"
+VERSION_FORMAT = "%Y%m%d_%H%M%S"
+MODEL_DIR_PATTERN = re.compile(r"^model_(.+)_(\d{8}_\d{6})$")
+
+
+def load_manifest(models_dir):
+    """{workspace_id: {"model_dir", "scaler_path", "version"}} for each active version, or None without a manifest"""
+    path = os.path.join(models_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+
+    resolved = {}
+    for workspace_id, workspace in manifest.get("workspaces", {}).items():
+        entry = workspace.get("versions", {}).get(workspace.get("active"))
+        if entry is None:
+            continue
+        resolved[workspace_id] = {
+            "model_dir": os.path.join(models_dir, entry["model_dir"]),
+            "scaler_path": os.path.join(models_dir, entry["scaler"]) if entry.get("scaler") else None,
+            "version": workspace["active"],
+            "config_hash": entry.get("config_hash")
+        }
+    return resolved
+
+
+def scan_model_dirs(models_dir):
+    """Same shape as load_manifest, from model_<workspace_id>_<YYYYmmdd_HHMMSS> directories (newest version wins)
+
+    The version suffix is matched in full, so workspace ids may contain underscores.
+    """
+    resolved = {}
+    for name in sorted(os.listdir(models_dir)) if os.path.isdir(models_dir) else []:
+        match = MODEL_DIR_PATTERN.match(name)
+        if not match or not os.path.isdir(os.path.join(models_dir, name)):
+            continue
+        workspace_id, version = match.groups()
+        scaler_path = os.path.join(models_dir, f"scaler_{workspace_id}_{version}.pkl")
+        resolved[workspace_id] = {
+            "model_dir": os.path.join(models_dir, name),
+            "scaler_path": scaler_path if os.path.exists(scaler_path) else None,
+            "version": version,
+            "config_hash": None
+        }
+    return resolved
+
+
+def model_size_bytes(model):
+    """Approximate resident size: the loaded artifact for runtime models, parameters and buffers otherwise"""
+    size = getattr(model, "size_bytes", None)
+    if size is not None:
+        return size
+    if hasattr(model, "state_dict"):
+        return sum(t.numel() * t.element_size() for t in model.state_dict().values() if torch.is_tensor(t))
+    return 0
+
+
+class ModelRegistry:
+    """Index of every workspace's latest model artifacts, loaded on first use.
+
+    Loaded models are kept in least-recently-used order and evicted once more than
+    max_models are loaded or their estimated size exceeds max_memory_mb (None = no limit).
+    loader(workspace_id, entry) returns (model, scaler) for an index entry.
+    """
+
+    def __init__(self, loader, max_models=None, max_memory_mb=None, on_evict=None):
+        self._loader = loader
+        self._on_evict = on_evict
+        self.max_models = max_models
+        self.max_memory_mb = max_memory_mb
+
+        self.index = {}  # {workspace_id: {"model_dir": ..., "scaler_path": ..., ...}}
+        self._loaded = OrderedDict()  # {workspace_id: (model, scaler, size_bytes)}, least recently used first
+        self._lock = threading.RLock()
+        self._load_locks = {}  # {workspace_id: Lock} held while that workspace's model loads
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.swaps = 0
+        self.load_seconds = 0.0
+
+    def set_index(self, index):
+        """Replace the index; loaded models whose artifacts changed or disappeared are dropped"""
+        with self._lock:
+            for workspace_id in list(self._loaded):
+                entry = index.get(workspace_id)
+                if entry is None or entry["model_dir"] != self.index[workspace_id]["model_dir"]:
+                    self._evict(workspace_id, reason="replaced" if entry else "removed")
+            self.index = dict(index)
+
+    def install(self, workspace_id, entry, model=None, scaler=None):
+        """Point a workspace at new artifacts; a preloaded (model, scaler) replaces the loaded pair
+        in one step, otherwise any loaded model is dropped and the new one loads on next use"""
+        with self._lock:
+            self.index[workspace_id] = entry
+            if model is not None:
+                self._loaded[workspace_id] = (model, scaler, model_size_bytes(model))
+                self._loaded.move_to_end(workspace_id)
+                self.swaps += 1
+                if self._on_evict:
+                    self._on_evict(workspace_id)
+                self._enforce_budget(keep=workspace_id)
+            elif workspace_id in self._loaded:
+                self._evict(workspace_id, reason="replaced")
+
+    def remove(self, workspace_id):
+
+        with self._lock:
+            self.index.pop(workspace_id, None)
+            if workspace_id in self._loaded:
+                self._evict(workspace_id, reason="removed")
+
+    def is_loaded(self, workspace_id):
+        return workspace_id in self._loaded
+
+    def __contains__(self, workspace_id):
+        return workspace_id in self.index
+
+    def workspaces(self):
+        return list(self.index)
+
+    def get(self, workspace_id):
+        """(model, scaler) for the workspace, loading it on a miss; None if it has no model or fails to load"""
+        with self._lock:
+            if workspace_id in self._loaded:
+                return self._hit(workspace_id)
+            if workspace_id not in self.index:
+                return None
+            load_lock = self._load_locks.setdefault(workspace_id, threading.Lock())
+
+        # Load outside the registry lock so hits on other workspaces aren't held up by a slow load;
+        # the per-workspace lock makes concurrent misses wait for one load instead of repeating it
+        with load_lock:
+            with self._lock:
+                if workspace_id in self._loaded:
+                    return self._hit(workspace_id)
+                entry = self.index.get(workspace_id)
+                if entry is None:
+                    return None
+                self.misses += 1
+
+            start = time.perf_counter()
+            try:
+                model, scaler = self._loader(workspace_id, entry)
+            except Exception as e:
+                with self._lock:
+                    self.load_failures += 1
+                print(f"[ModelRegistry] Failed to load model for {workspace_id}: {e}")
+                return None
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+                # Re-pointed or swapped while loading: serve this call, but don't cache the outdated model
+                if self.index.get(workspace_id) != entry or workspace_id in self._loaded:
+                    return model, scaler
+                self._loaded[workspace_id] = (model, scaler, model_size_bytes(model))
+                self._enforce_budget(keep=workspace_id)
+                print(f"[ModelRegistry] Loaded {workspace_id} in {elapsed * 1000:.0f} ms "
+                      f"({len(self._loaded)}/{len(self.index)} loaded)")
+            return model, scaler
+
+    def _hit(self, workspace_id):
+        self.hits += 1
+        self._loaded.move_to_end(workspace_id)
+        model, scaler, _ = self._loaded[workspace_id]
+        return model, scaler
+
+    def _memory_bytes(self):
+        return sum(size for _, _, size in self._loaded.values())
+
+    def _over_budget(self):
+        if self.max_models is not None and len(self._loaded) > self.max_models:
+            return True
+        return self.max_memory_mb is not None and self._memory_bytes() > self.max_memory_mb * 1024 * 1024
+
+    def _enforce_budget(self, keep):
+        # The model just requested is never evicted, even if it alone exceeds the budget
+        for workspace_id in list(self._loaded):
+            if not self._over_budget():
+                break
+            if workspace_id != keep:
+                self._evict(workspace_id, reason="least recently used")
+
+    def _evict(self, workspace_id, reason):
+        del self._loaded[workspace_id]
+        self.evictions += 1
+        print(f"[ModelRegistry] Evicted {workspace_id} ({reason})")
+        if self._on_evict:
+            self._on_evict(workspace_id)
+
+    def stats(self):
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "indexed": len(self.index),
+                "loaded": len(self._loaded),
+                "loaded_workspaces": list(self._loaded),  # least recently used first
+                "max_models": self.max_models,
+                "max_memory_mb": self.max_memory_mb,
+                "memory_mb": round(self._memory_bytes() / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "evictions": self.evictions,
+                "swaps": self.swaps,
+                "total_load_seconds": round(self.load_seconds, 3),
+                "avg_load_ms": round(self.load_seconds / self.loads * 1000, 1) if self.loads else None
+            }
@@ -0,0 +1,98 @@
+# services/model_runtime.py
+
+import os
+import json
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+
+# Written by train_distributed.export_runtime_model next to each saved model
+RUNTIME_DIR = "runtime"
+RUNTIME_META_FILE = "runtime.json"
+
+
+def has_runtime_artifacts(model_dir):
+
+    return os.path.exists(os.path.join(model_dir, RUNTIME_DIR, RUNTIME_META_FILE))
+
+
+class FoldedScaler:
+    """MinMaxScaler.transform from exported scale/min arrays, without sklearn or pickle"""
+
+    def __init__(self, scale, min_):
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.min_ = np.asarray(min_, dtype=np.float64)
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+
+class RuntimeModel:
+    """Exported forecast model (ONNX via onnxruntime, or TorchScript) behind the PatchTST call interface.
+
+    backend: "onnx", "torchscript", or "auto" (ONNX when the artifact and onnxruntime are available).
+    quantized: prefer the int8 TorchScript trace, only exported when it passed the training-time accuracy gate.
+    Always runs on CPU.
+    """
+
+    def __init__(self, model_dir, backend="auto", quantized=False):
+        self.model_dir = model_dir
+        runtime_dir = os.path.join(model_dir, RUNTIME_DIR)
+        with open(os.path.join(runtime_dir, RUNTIME_META_FILE)) as f:
+            self.meta = json.load(f)
+
+        self.config = SimpleNamespace(
+            context_length=self.meta["context_length"],
+            prediction_length=self.meta["prediction_length"],
+            num_input_channels=self.meta["num_input_channels"]
+        )
+
+        files = self.meta.get("files", {})
+        self._session = None
+        self._module = None
+
+        if quantized and backend in ("auto", "torchscript") and "torchscript_int8" in files:
+            self._module = torch.jit.load(os.path.join(runtime_dir, files["torchscript_int8"]), map_location="cpu")
+            self._module.eval()
+            self.backend = "torchscript-int8"
+            self.size_bytes = os.path.getsize(os.path.join(runtime_dir, files["torchscript_int8"]))
+
+        if self._module is None and backend in ("auto", "onnx") and "onnx" in files:
+            try:
+                import onnxruntime
+                self._session = onnxruntime.InferenceSession(os.path.join(runtime_dir, files["onnx"]),
+                                                             providers=["CPUExecutionProvider"])
+                self.backend = "onnx"
+                self.size_bytes = os.path.getsize(os.path.join(runtime_dir, files["onnx"]))
+            except ImportError:
+                if backend == "onnx":
+                    raise
+
+        if self._session is None and self._module is None:
+            if "torchscript" not in files:
+                raise FileNotFoundError(f"No {backend} runtime artifact in {runtime_dir}")
+            self._module = torch.jit.load(os.path.join(runtime_dir, files["torchscript"]), map_location="cpu")
+            self._module.eval()
+            self.backend = "torchscript"
+            self.size_bytes = os.path.getsize(os.path.join(runtime_dir, files["torchscript"]))
+
+    def scalers(self):
+        """{workspace_id: FoldedScaler} for the workspaces the model was trained on"""
+        return {workspace_id: FoldedScaler(s["scale"], s["min"]) for workspace_id, s in self.meta.get("scalers", {}).items()}
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def __call__(self, past_values):
+        if self._session is not None:
+            outputs = self._session.run(None, {"past_values": past_values.cpu().numpy()})[0]
+            prediction = torch.from_numpy(outputs)
+        else:
+            with torch.no_grad():
+                prediction = self._module(past_values.cpu())
+        # Same attribute the HF PatchTST output exposes
+        return SimpleNamespace(prediction_outputs=prediction)
@@ -1,12 +1,20 @@
 # services/real_influx_streamer.py
 
+import sys
 import time
+import numpy as np
 import pandas as pd
 import os
+from datetime import datetime, timedelta, timezone
 from influxdb_client import InfluxDBClient
-from services.inference_service import InferenceService
+from services.inference_service import InferenceService, FEATURE_NAMES
+from services.ring_buffer import WorkspaceRingBuffer
 from dotenv import load_dotenv
 
+# The Flux CSV decoder is shared with spark-apps/train_distributed.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "spark-apps"))
+from flux_csv import read_flux_tables
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -16,8 +24,11 @@ influx_token = os.getenv("INFLUX_TOKEN")
 influx_org = os.getenv("INFLUX_ORG", "Ruhuna_Eng")
 influx_bucket = os.getenv("INFLUX_BUCKET", "New_Sensor")
 
+# Buffers idle longer than this (or 3 intervals, if longer) don't hold the fleet delta query's start back
+FLEET_DELTA_MAX_LAG_SECONDS = 120
+
 class RealInfluxStreamer:
-    def __init__(self, interval_seconds=10, lookback_minutes=60):
+    def __init__(self, interval_seconds=10, lookback_minutes=60, fetch_mode="fleet"):
       
         self.influx_client = InfluxDBClient(
             url=influx_url, 
@@ -27,12 +38,14 @@ class RealInfluxStreamer:
         self.influx_bucket = influx_bucket
         self.interval = interval_seconds
         self.lookback_minutes = lookback_minutes
+        self.fetch_mode = fetch_mode  # "fleet": one query per cycle, "workspace": discovery + one query per workspace
+        self.buffers = {}  # {workspace_id: WorkspaceRingBuffer}
         
     
         self.inference_service = InferenceService()
         
         print(f"[RealInfluxStreamer] Initialized for direct InfluxDB inference")
-        print(f"[RealInfluxStreamer] Inference interval: {interval_seconds}s, Lookback: {lookback_minutes}min")
+        print(f"[RealInfluxStreamer] Inference interval: {interval_seconds}s, Lookback: {lookback_minutes}min, Fetch mode: {fetch_mode}")
         print(f"[RealInfluxStreamer] Available workspaces: {self.inference_service.get_available_workspaces()}")
 
     def _get_available_workspaces_from_influx(self):
@@ -58,13 +71,32 @@ class RealInfluxStreamer:
             print(f"[RealInfluxStreamer] Error discovering workspaces: {e}")
             return []
     
-    def _fetch_workspace_data(self, workspace_id, lookback_override=None):
+    def _query_feature_frame(self, query, extra_columns=()):
+        """Run a pivoted query and decode the CSV response column-wise into float32 feature columns"""
+        df = read_flux_tables(self.influx_client.query_api(), query, ["_time", *FEATURE_NAMES, *extra_columns])
+        if df.empty:
+            return pd.DataFrame(columns=["timestamp", *FEATURE_NAMES, *extra_columns])
+        
+        # Flux drops trailing zeros from fractional seconds, so the format varies per row
+        frame = pd.DataFrame({"timestamp": pd.to_datetime(df["_time"], utc=True, format="ISO8601")})
+        for feature in FEATURE_NAMES:
+            if feature in df:
+                frame[feature] = df[feature].astype(np.float32).fillna(0)
+            else:
+                frame[feature] = np.float32(0)
+        for column in extra_columns:
+            frame[column] = df[column] if column in df else None
+        
+        return frame.reset_index(drop=True)
+    
+    def _fetch_workspace_data(self, workspace_id, lookback_override=None, start_time=None):
        
         lookback = lookback_override if lookback_override else self.lookback_minutes
         
+        # Delta queries start at the last row already buffered
         query = f'''
         from(bucket: "{self.influx_bucket}")
-          |> range(start: -{lookback}m)
+          |> range(start: {self._range_start(start_time, lookback)})
           |> filter(fn: (r) => r._measurement == "sensor_data")
           |> filter(fn: (r) => r.workspace_id == "{workspace_id}")
           |> pivot(
@@ -76,27 +108,13 @@ class RealInfluxStreamer:
         '''
         
         try:
-            result = self.influx_client.query_api().query(query)
-            
-            data_points = []
+            df = self._query_feature_frame(query)
             
-            for table in result:
-                for record in table.records:
-                    data_points.append({
-                        "timestamp": record.get_time(),
-                        "current": float(record.values.get("current", 0)),
-                        "accX": float(record.values.get("accX", 0)),
-                        "accY": float(record.values.get("accY", 0)),
-                        "accZ": float(record.values.get("accZ", 0)),
-                        "tempA": float(record.values.get("tempA", 0)),
-                        "tempB": float(record.values.get("tempB", 0)),
-                    })
-            
-            if not data_points:
-                print(f"[RealInfluxStreamer] No data found for {workspace_id}")
+            if df.empty:
+                if start_time is None:
+                    print(f"[RealInfluxStreamer] No data found for {workspace_id}")
                 return None
             
-            df = pd.DataFrame(data_points)
             print(f"[RealInfluxStreamer] Fetched {len(df)} data points for {workspace_id}")
             return df
             
@@ -104,6 +122,110 @@ class RealInfluxStreamer:
             print(f"[RealInfluxStreamer] Error fetching data for {workspace_id}: {e}")
             return None
 
+    def _range_start(self, start_time, lookback):
+        
+        if start_time is not None:
+            return f'time(v: "{start_time.isoformat()}")'
+        return f"-{lookback}m"
+
+    def _fetch_fleet_data(self, start_time=None):
+        """Fetch all workspaces' rows in one query, demultiplexed into {workspace_id: DataFrame}"""
+        query = f'''
+        from(bucket: "{self.influx_bucket}")
+          |> range(start: {self._range_start(start_time, self.lookback_minutes)})
+          |> filter(fn: (r) => r._measurement == "sensor_data")
+          |> pivot(
+              rowKey: ["_time"],
+              columnKey: ["_field"],
+              valueColumn: "_value"
+          )
+          |> group(columns: ["workspace_id"])
+          |> sort(columns: ["_time"], desc: false)
+        '''
+        
+        try:
+            df = self._query_feature_frame(query, extra_columns=["workspace_id"])
+            df = df.dropna(subset=["workspace_id"])
+            
+            fleet_data = {
+                workspace_id: rows.drop(columns="workspace_id").reset_index(drop=True)
+                for workspace_id, rows in df.groupby("workspace_id", sort=False)
+            }
+            total_points = sum(len(df) for df in fleet_data.values())
+            print(f"[RealInfluxStreamer] Fetched {total_points} data points for {len(fleet_data)} workspace(s) in one query")
+            return fleet_data
+            
+        except Exception as e:
+            print(f"[RealInfluxStreamer] Error fetching fleet data: {e}")
+            return {}
+
+    def _update_fleet_buffers(self):
+        """Top up every workspace's buffer from one fleet query and return the active workspaces"""
+        now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(minutes=self.lookback_minutes)
+        for workspace_id in list(self.buffers):
+            last_seen_time = self.buffers[workspace_id].last_seen_time
+            if last_seen_time is None or last_seen_time < stale_before:
+                del self.buffers[workspace_id]
+        
+        # Start at the oldest recently updated buffer so no active workspace misses rows; the buffers drop overlaps.
+        # Quiet workspaces are left out, so one idle machine doesn't make every cycle re-download the fleet
+        idle_before = now - timedelta(seconds=max(FLEET_DELTA_MAX_LAG_SECONDS, 3 * self.interval))
+        recent = [buffer.last_seen_time for buffer in self.buffers.values() if buffer.last_seen_time >= idle_before]
+        start_time = min(recent) if recent else (idle_before if self.buffers else None)
+        fleet_data = self._fetch_fleet_data(start_time)
+        
+        for workspace_id, sensor_data in fleet_data.items():
+            if not self.inference_service.has_model(workspace_id):
+                continue
+            
+            context_length = self.inference_service.get_context_length(workspace_id)
+            buffer = self.buffers.get(workspace_id)
+            
+            if buffer is None or buffer.capacity != context_length:
+                buffer = WorkspaceRingBuffer(context_length, num_features=len(FEATURE_NAMES))
+                self.buffers[workspace_id] = buffer
+                
+                # A workspace first seen in a delta response still needs its history seeded
+                if start_time is not None:
+                    seed_data = self._fetch_workspace_data(workspace_id)
+                    if seed_data is not None:
+                        buffer.extend(seed_data["timestamp"], seed_data[FEATURE_NAMES].to_numpy())
+            
+            # A quiet workspace that resumed catches up on rows older than the fleet query's start
+            elif start_time is not None and buffer.last_seen_time < start_time:
+                gap_data = self._fetch_workspace_data(workspace_id, start_time=buffer.last_seen_time)
+                if gap_data is not None:
+                    buffer.extend(gap_data["timestamp"], gap_data[FEATURE_NAMES].to_numpy())
+            
+            buffer.extend(sensor_data["timestamp"], sensor_data[FEATURE_NAMES].to_numpy())
+        
+        # Discovery comes from the same response plus workspaces still buffered within the lookback
+        return sorted(set(self.buffers) | set(fleet_data))
+
+    def _update_workspace_buffer(self, workspace_id):
+        """Seed the workspace's ring buffer once, then top it up with only the rows newer than last seen"""
+        context_length = self.inference_service.get_context_length(workspace_id)
+        buffer = self.buffers.get(workspace_id)
+        
+        # A reloaded model may use a different context length
+        if buffer is None or buffer.capacity != context_length:
+            buffer = WorkspaceRingBuffer(context_length, num_features=len(FEATURE_NAMES))
+            self.buffers[workspace_id] = buffer
+        
+        # After a gap longer than the lookback the buffered rows are stale, so reseed
+        if buffer.last_seen_time is not None:
+            stale_before = datetime.now(timezone.utc) - timedelta(minutes=self.lookback_minutes)
+            if buffer.last_seen_time < stale_before:
+                buffer.reset()
+        
+        sensor_data = self._fetch_workspace_data(workspace_id, start_time=buffer.last_seen_time)
+        
+        if sensor_data is not None:
+            buffer.extend(sensor_data["timestamp"], sensor_data[FEATURE_NAMES].to_numpy())
+        
+        return buffer
+
     def start_stream(self):
         
         print(f"[RealInfluxStreamer] Starting direct InfluxDB inference (interval: {self.interval}s)...")
@@ -111,7 +233,10 @@ class RealInfluxStreamer:
         while True:
             try:
                 
-                active_workspaces = self._get_available_workspaces_from_influx()
+                if self.fetch_mode == "fleet":
+                    active_workspaces = self._update_fleet_buffers()
+                else:
+                    active_workspaces = self._get_available_workspaces_from_influx()
                 
                 if not active_workspaces:
                     print("[RealInfluxStreamer] No active workspaces found in InfluxDB")
@@ -120,26 +245,43 @@ class RealInfluxStreamer:
                 
                 print(f"[RealInfluxStreamer] Active workspaces: {active_workspaces}")
                 
-                # Process each workspace
+                # Drop buffers of workspaces that stopped reporting
+                for workspace_id in list(self.buffers):
+                    if workspace_id not in active_workspaces:
+                        del self.buffers[workspace_id]
+                
+                # Collect data for every workspace due this cycle
+                due_workspaces = {}
                 for workspace_id in active_workspaces:
                     # Check if model exists for this workspace
-                    if workspace_id not in self.inference_service.models:
+                    if not self.inference_service.has_model(workspace_id):
                         print(f"[RealInfluxStreamer] No model loaded for {workspace_id}, skipping...")
                         continue
                     
-                    # Fetch data directly from InfluxDB
-                    sensor_data = self._fetch_workspace_data(workspace_id)
+                    # Top up the workspace's buffer with rows that arrived since the last cycle
+                    if self.fetch_mode == "fleet":
+                        buffer = self.buffers.get(workspace_id)
+                    else:
+                        buffer = self._update_workspace_buffer(workspace_id)
                     
-                    if sensor_data is None or len(sensor_data) < 50:
-                        print(f"[RealInfluxStreamer] Insufficient data for {workspace_id} (need 50 points)")
+                    if buffer is None or not buffer.is_full():
+                        have = buffer.size if buffer is not None else 0
+                        print(f"[RealInfluxStreamer] Insufficient data for {workspace_id} (have {have} points, need a full context window)")
                         continue
                     
-                    # Run inference directly with InfluxDB data
-                    forecast, alerts = self.inference_service.run_inference(workspace_id, sensor_data)
-                    
+                    due_workspaces[workspace_id] = buffer.window()
+                
+                if not due_workspaces:
+                    time.sleep(self.interval)
+                    continue
+                
+                # Run inference for all due workspaces in one batched call
+                results = self.inference_service.run_batch_inference(due_workspaces)
+                
+                for workspace_id, (forecast, alerts) in results.items():
                     if forecast is not None:
                         print(f"[RealInfluxStreamer] {workspace_id}: Forecast shape: {forecast.shape}")
-                        print(f"[RealInfluxStreamer] {workspace_id}: {alerts['message']}")
+                    print(f"[RealInfluxStreamer] {workspace_id}: {alerts['message']}")
                     
             except Exception as e:
                 print(f"[RealInfluxStreamer] Error in stream loop: {e}")
@@ -154,10 +296,15 @@ class RealInfluxStreamer:
     def validate_workspace_model(self, workspace_id):
        
        
-        for lookback_minutes in [3, 5, 10, 30]:
+        # The model decides how many rows it needs: its context window plus the horizon to score
+        needed = self.inference_service.get_validation_length(workspace_id)
+        if needed is None:
+            return self.inference_service.validate_model(workspace_id, None)
+        
+        for lookback_minutes in [3, 5, 10, 30, self.lookback_minutes]:
             data = self._fetch_workspace_data(workspace_id, lookback_override=lookback_minutes)
             
-            if data is not None and len(data) >= 60:
+            if data is not None and len(data) >= needed:
                 print(f"[Validation] Using {len(data)} data points from last {lookback_minutes} minutes")
                 return self.inference_service.validate_model(workspace_id, data)
         
@@ -165,5 +312,5 @@ class RealInfluxStreamer:
         data_count = len(data) if data is not None else 0
         return {
             "status": "error", 
-            "message": f"Insufficient data for validation. Found {data_count} points, need at least 60. Data may be too recent or sparse."
+            "message": f"Insufficient data for validation. Found {data_count} points, need at least {needed}. Data may be too recent or sparse."
         }
@@ -0,0 +1,68 @@
+# services/ring_buffer.py
+
+import numpy as np
+
+
+class WorkspaceRingBuffer:
+    """Fixed-size window of the most recent sensor rows for one workspace.
+
+    Seeded once from a full lookback query, then topped up with the rows
+    returned by delta queries. Rows not newer than the last seen timestamp
+    are dropped, so overlapping query ranges are harmless.
+    """
+
+    def __init__(self, capacity, num_features=6):
+
+        self.capacity = capacity
+        self.values = np.zeros((capacity, num_features), dtype=np.float32)
+        self.size = 0
+        self.head = 0  # Next write position
+        self.last_seen_time = None
+
+    def extend(self, timestamps, rows):
+        """Append rows (oldest first) and return how many were new"""
+        rows = np.asarray(rows, dtype=np.float32)
+        timestamps = list(timestamps)
+
+        if self.last_seen_time is not None:
+            first_new = 0
+            while first_new < len(timestamps) and timestamps[first_new] <= self.last_seen_time:
+                first_new += 1
+            timestamps = timestamps[first_new:]
+            rows = rows[first_new:]
+
+        count = len(rows)
+        if count == 0:
+            return 0
+
+        self.last_seen_time = timestamps[-1]
+
+        # Only the newest `capacity` rows can survive
+        if count >= self.capacity:
+            self.values[:] = rows[-self.capacity:]
+            self.head = 0
+            self.size = self.capacity
+            return count
+
+        first_part = min(count, self.capacity - self.head)
+        self.values[self.head:self.head + first_part] = rows[:first_part]
+        self.values[:count - first_part] = rows[first_part:]
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return count
+
+    def is_full(self):
+
+        return self.size == self.capacity
+
+    def window(self):
+        """Buffered rows in chronological order"""
+        if self.size < self.capacity:
+            return self.values[:self.size].copy()
+        return np.concatenate((self.values[self.head:], self.values[:self.head]))
+
+    def reset(self):
+
+        self.size = 0
+        self.head = 0
+        self.last_seen_time = None
@@ -4,17 +4,29 @@ Generates realistic machine sensor data and publishes to MQTT broker
 """
 
 import json
+import os
+import sys
 import time
 import random
 import math
+import argparse
+import multiprocessing
+from collections import deque
 from datetime import datetime
 import paho.mqtt.client as mqtt
 
+# The binary payload codec lives with the bridge so both sides share one definition
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "vm-automation"))
+from sensor_codec import encode_binary, binary_topic, decode_payload
+
 
 MQTT_BROKER = "142.93.220.152"  
 MQTT_PORT = 1883
 MQTT_TOPIC = "sensor/data"
 
+# "json" publishes to MQTT_TOPIC; "binary" publishes the compact struct to sensor/bin/<workspace_id>
+PAYLOAD_FORMAT = "json"
+
 
 WORKSPACES = [
     "cnc-mill-5-axis",
@@ -23,10 +35,47 @@ WORKSPACES = [
     "68889e4d171eff841cba171a"
 ]
 
+# Base values for each workspace
+WORKSPACE_CONFIGS = {
+    "cnc-mill-5-axis": {
+        "current": 12.5,
+        "accX": 0.15,
+        "accY": 0.12,
+        "accZ": 0.18,
+        "tempA": 45.0,
+        "tempB": 42.0
+    },
+    "lathe-1-spindle": {
+        "current": 15.0,
+        "accX": 0.20,
+        "accY": 0.15,
+        "accZ": 0.25,
+        "tempA": 50.0,
+        "tempB": 48.0
+    },
+    "robot-arm-02": {
+        "current": 8.5,
+        "accX": 0.10,
+        "accY": 0.08,
+        "accZ": 0.12,
+        "tempA": 38.0,
+        "tempB": 36.0
+    },
+    "68889e4d171eff841cba171a": {
+        "current": 10.0,
+        "accX": 0.13,
+        "accY": 0.11,
+        "accZ": 0.16,
+        "tempA": 40.0,
+        "tempB": 38.0
+    }
+}
+
 class SensorDataGenerator:
-    def __init__(self):
+    def __init__(self, payload_format=PAYLOAD_FORMAT):
         self.client = mqtt.Client()
         self.connected = False
+        self.payload_format = payload_format
         
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -89,8 +138,13 @@ class SensorDataGenerator:
     def publish_data(self, data):
         """Publish sensor data to MQTT"""
         try:
-            payload = json.dumps(data)
-            result = self.client.publish(MQTT_TOPIC, payload, qos=1)
+            if self.payload_format == "binary":
+                topic = binary_topic(data["workspace_id"], data.get("sensor_type"))
+                payload = encode_binary(data)
+            else:
+                topic = MQTT_TOPIC
+                payload = json.dumps(data)
+            result = self.client.publish(topic, payload, qos=1)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 return True
             else:
@@ -111,50 +165,18 @@ class SensorDataGenerator:
         if not self.connect():
             return
         
-        # Base values for each workspace
-        workspace_configs = {
-            "cnc-mill-5-axis": {
-                "current": 12.5,
-                "accX": 0.15,
-                "accY": 0.12,
-                "accZ": 0.18,
-                "tempA": 45.0,
-                "tempB": 42.0
-            },
-            "lathe-1-spindle": {
-                "current": 15.0,
-                "accX": 0.20,
-                "accY": 0.15,
-                "accZ": 0.25,
-                "tempA": 50.0,
-                "tempB": 48.0
-            },
-            "robot-arm-02": {
-                "current": 8.5,
-                "accX": 0.10,
-                "accY": 0.08,
-                "accZ": 0.12,
-                "tempA": 38.0,
-                "tempB": 36.0
-            },
-            "68889e4d171eff841cba171a": {
-                "current": 10.0,
-                "accX": 0.13,
-                "accY": 0.11,
-                "accZ": 0.16,
-                "tempA": 40.0,
-                "tempB": 38.0
-            }
-        }
-        
         print(f"\n🚀 Starting data generation...")
         print(f"   Workspaces: {', '.join(WORKSPACES)}")
         print(f"   Interval: {interval_seconds} seconds")
+        print(f"   Payload format: {self.payload_format}")
         if duration_minutes:
             print(f"   Duration: {duration_minutes} minutes")
         else:
             print(f"   Duration: Infinite (Ctrl+C to stop)")
-        print(f"   Topic: {MQTT_TOPIC}\n")
+        if self.payload_format == "binary":
+            print(f"   Topic: {binary_topic('<workspace_id>')}\n")
+        else:
+            print(f"   Topic: {MQTT_TOPIC}\n")
         
         start_time = time.time()
         count = 0
@@ -171,7 +193,7 @@ class SensorDataGenerator:
                 
                 # Generate data for each workspace
                 for workspace in WORKSPACES:
-                    base_values = workspace_configs[workspace]
+                    base_values = WORKSPACE_CONFIGS[workspace]
                     
                     # Inject anomalies occasionally (5% chance)
                     if random.random() < 0.05:
@@ -203,19 +225,237 @@ class SensorDataGenerator:
             print("✅ Disconnected from MQTT broker")
 
 
+# ---------------------------------------------------------------------------
+# Load-test mode: thousands of synthetic workspaces, no per-message printing
+# ---------------------------------------------------------------------------
+
+LOAD_PROFILES = ("constant", "ramp", "burst")
+LOAD_REPORT_INTERVAL = 5  # seconds between progress lines
+BROKER_LATENCY_SAMPLES = 20000  # most recent probe samples kept for percentiles
+
+
+def load_workspace_ids(count):
+    return [f"load-{i:05d}" for i in range(count)]
+
+
+def profile_multiplier(args, elapsed):
+    """Fraction of the target rate to publish at, elapsed seconds into the run"""
+    if args.profile == "ramp":
+        return min(1.0, elapsed / args.ramp_seconds) if args.ramp_seconds > 0 else 1.0
+    if args.profile == "burst":
+        return args.burst_factor if (elapsed % args.burst_period) < args.burst_seconds else 1.0
+    return 1.0
+
+
+def _load_worker(worker_id, workspaces, args, counters, start_time):
+    """Publisher process: paces its slice of workspaces at rate x profile multiplier"""
+    client = mqtt.Client(client_id=f"loadgen-{worker_id}-{os.getpid()}")
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    # Each synthetic machine gets one of the real machines' profiles as its baseline
+    profiles = list(WORKSPACE_CONFIGS.values())
+    base_values = [profiles[i % len(profiles)] for i in range(len(workspaces))]
+    topics = [binary_topic(workspace) for workspace in workspaces]
+
+    base_rate = len(workspaces) * args.rate  # messages/second for this process at multiplier 1
+    budget = 0.0
+    published = failed = 0
+    next_index = 0
+    last = time.time()
+
+    try:
+        while True:
+            now = time.time()
+            elapsed = now - start_time
+            if elapsed >= args.duration:
+                break
+
+            rate = base_rate * profile_multiplier(args, elapsed)
+            # Cap the backlog at one second so a stall doesn't turn into a catch-up storm
+            budget = min(budget + rate * (now - last), max(1.0, rate))
+            last = now
+
+            while budget >= 1.0:
+                workspace = workspaces[next_index]
+                base = base_values[next_index]
+                data = {
+                    "workspace_id": workspace,
+                    "current": round(base["current"] + random.uniform(-0.5, 0.5), 2),
+                    "accX": round(base["accX"] + random.uniform(-0.2, 0.2), 3),
+                    "accY": round(base["accY"] + random.uniform(-0.2, 0.2), 3),
+                    "accZ": round(base["accZ"] + random.uniform(-0.2, 0.2), 3),
+                    "tempA": round(base["tempA"] + random.uniform(-1.0, 1.0), 1),
+                    "tempB": round(base["tempB"] + random.uniform(-1.0, 1.0), 1),
+                }
+                sent_ns = time.time_ns()
+                if args.format == "binary":
+                    result = client.publish(topics[next_index], encode_binary(data, sent_ns), qos=args.qos)
+                else:
+                    data["sent_ns"] = sent_ns
+                    result = client.publish(MQTT_TOPIC, json.dumps(data), qos=args.qos)
+
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    published += 1
+                else:
+                    failed += 1
+                next_index = (next_index + 1) % len(workspaces)
+                budget -= 1.0
+
+            counters[worker_id * 2] = published
+            counters[worker_id * 2 + 1] = failed
+            time.sleep(0.005)
+    finally:
+        counters[worker_id * 2] = published
+        counters[worker_id * 2 + 1] = failed
+        client.loop_stop()
+        client.disconnect()
+
+
+class BrokerLatencyProbe:
+    """Subscribes alongside the bridge and measures publish -> broker delivery latency from embedded send timestamps
+
+    Only the MQTT leg: the bridge's batching and spool and the InfluxDB write come after delivery,
+    so they are not included (the bridge log reports its own receive lag and write rate).
+    """
+
+    def __init__(self, args, probe_workspaces):
+        self.samples = deque(maxlen=BROKER_LATENCY_SAMPLES)
+        self.client = mqtt.Client(client_id=f"loadgen-probe-{os.getpid()}")
+        self.client.on_message = self.on_message
+        self.client.connect(args.broker, args.port, 60)
+        if args.format == "binary":
+            self.client.subscribe([(binary_topic(workspace), 0) for workspace in probe_workspaces])
+        else:
+            self.client.subscribe(MQTT_TOPIC)
+        self.client.loop_start()
+
+    def on_message(self, client, userdata, msg):
+        received_ns = time.time_ns()
+        try:
+            sent_ns = decode_payload(msg.topic, msg.payload).get("sent_ns")
+        except Exception:
+            return
+        if sent_ns:
+            self.samples.append((received_ns - sent_ns) / 1e6)
+
+    def percentiles(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return pick(0.50), pick(0.95), pick(0.99), ordered[-1]
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def run_load_test(args):
+    """Publish from several processes at a configurable fleet size and rate, reporting achieved rate and broker latency"""
+    workspaces = load_workspace_ids(args.workspaces)
+    processes = max(1, min(args.processes, len(workspaces)))
+    slices = [workspaces[i::processes] for i in range(processes)]
+    target_rate = len(workspaces) * args.rate
+
+    print(f"\n🚀 Starting load test...")
+    print(f"   Workspaces: {len(workspaces)} synthetic ({args.rate} msgs/s each, target {target_rate:,.0f} msgs/s)")
+    print(f"   Profile: {args.profile}, Duration: {args.duration}s, Processes: {processes}")
+    print(f"   Payload format: {args.format}, QoS: {args.qos}\n")
+
+    probe = BrokerLatencyProbe(args, workspaces[:args.probe_workspaces]) if args.probe_workspaces > 0 else None
+
+    counters = multiprocessing.Array('q', processes * 2, lock=False)
+    start_time = time.time() + 1.0  # let every publisher connect before the clock starts
+    workers = [
+        multiprocessing.Process(target=_load_worker, args=(i, slices[i], args, counters, start_time), name=f"loadgen-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    last_published = 0
+    last_time = time.time()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(LOAD_REPORT_INTERVAL)
+            now = time.time()
+            published = sum(counters[i] for i in range(0, len(counters), 2))
+            failed = sum(counters[i] for i in range(1, len(counters), 2))
+            rate = (published - last_published) / (now - last_time)
+            target = target_rate * profile_multiplier(args, max(0.0, now - start_time))
+            line = f"[{now - start_time:6.0f}s] {rate:>10,.0f} msgs/s (target {target:,.0f}) | {published:,} sent, {failed:,} failed"
+            if probe:
+                latency = probe.percentiles()
+                if latency:
+                    line += " | broker latency ms p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(*latency)
+            print(line)
+            last_published, last_time = published, now
+    except KeyboardInterrupt:
+        print(f"\n\n🛑 Stopped by user")
+        for worker in workers:
+            worker.terminate()
+    finally:
+        for worker in workers:
+            worker.join()
+        if probe:
+            probe.stop()
+
+    elapsed = max(1e-9, min(time.time(), start_time + args.duration) - start_time)
+    published = sum(counters[i] for i in range(0, len(counters), 2))
+    failed = sum(counters[i] for i in range(1, len(counters), 2))
+    print(f"\n📊 Load test: {published:,} messages in {elapsed:.0f}s = {published / elapsed:,.0f} msgs/s average, {failed:,} failed")
+    if probe and probe.percentiles():
+        print("📊 Broker delivery latency ms (publish -> subscriber, excludes the InfluxDB write): p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(*probe.percentiles()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="IoT sensor data generator")
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--format", choices=["json", "binary"], default=PAYLOAD_FORMAT, help="Payload wire format")
+    parser.add_argument("--interval", type=float, default=2, help="Seconds between readings (normal mode)")
+
+    load = parser.add_argument_group("load test")
+    load.add_argument("--load-test", action="store_true", help="Simulate a large fleet instead of the four real workspaces")
+    load.add_argument("--workspaces", type=int, default=1000, help="Synthetic workspaces to simulate")
+    load.add_argument("--rate", type=float, default=0.5, help="Messages/second per workspace at full load")
+    load.add_argument("--processes", type=int, default=max(1, multiprocessing.cpu_count() - 1), help="Publisher processes")
+    load.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    load.add_argument("--profile", choices=LOAD_PROFILES, default="constant")
+    load.add_argument("--ramp-seconds", type=float, default=30, help="ramp: seconds to reach full rate")
+    load.add_argument("--burst-factor", type=float, default=5, help="burst: rate multiplier during a burst")
+    load.add_argument("--burst-seconds", type=float, default=5, help="burst: length of each burst")
+    load.add_argument("--burst-period", type=float, default=30, help="burst: seconds between burst starts")
+    load.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    load.add_argument("--probe-workspaces", type=int, default=10,
+                      help="Workspaces the broker latency probe subscribes to in binary format; with JSON it "
+                           "receives every message on the shared topic (0 disables the probe)")
+    return parser.parse_args()
+
+
 def main():
     """Main entry point"""
+    global MQTT_BROKER, MQTT_PORT
+    args = parse_args()
+    MQTT_BROKER, MQTT_PORT = args.broker, args.port
+
     print("=" * 70)
     print("  IoT SENSOR DATA GENERATOR")
     print("=" * 70)
     print(f"\n📍 Target: {MQTT_BROKER}:{MQTT_PORT}")
     print(f"📡 Topic: {MQTT_TOPIC}")
+
+    if args.load_test:
+        run_load_test(args)
+        return
+
     print(f"🏭 Workspaces: {len(WORKSPACES)}")
     
-    generator = SensorDataGenerator()
+    generator = SensorDataGenerator(payload_format=args.format)
     
     # Run forever (or specify duration in minutes)
-    generator.run(duration_minutes=None, interval_seconds=2)
+    generator.run(duration_minutes=None, interval_seconds=args.interval)
 
 
 if __name__ == "__main__":
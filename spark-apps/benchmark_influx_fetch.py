@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark InfluxDB fetch paths for training data
+Compares the per-record dict loop against the columnar CSV path used by load_workspace_data
+Reports rows/second and peak Python memory for each path
+
+Usage: py -3.11 benchmark_influx_fetch.py <workspace_id> [hours_back] [repeats]
+"""
+import sys
+import time
+import tracemalloc
+import pandas as pd
+from influxdb_client import InfluxDBClient
+from train_distributed import (
+    INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET, read_feature_frame
+)
+
+
+def build_query(workspace_id, hours_back):
+    return f'''
+    from(bucket: "{INFLUXDB_BUCKET}")
+        |> range(start: -{hours_back}h)
+        |> filter(fn: (r) => r._measurement == "sensor_data")
+        |> filter(fn: (r) => r.workspace_id == "{workspace_id}")
+        |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+    '''
+
+
+def fetch_with_record_loop(query_api, query):
+    """The previous implementation: one FluxRecord and one dict per row"""
+    result = query_api.query(query=query)
+
+    records = []
+    for table in result:
+        for record in table.records:
+            records.append({
+                'time': record.get_time(),
+                'current': float(record.values.get('current', 0)),
+                'accX': float(record.values.get('accX', 0)),
+                'accY': float(record.values.get('accY', 0)),
+                'accZ': float(record.values.get('accZ', 0)),
+                'tempA': float(record.values.get('tempA', 0)),
+                'tempB': float(record.values.get('tempB', 0))
+            })
+
+    return pd.DataFrame(records)
+
+
+def fetch_columnar(query_api, query):
+    return read_feature_frame(query_api, query)
+
+
+def measure(fetch, query_api, query, repeats):
+    """Best-of-N wall time, plus peak traced memory of one run"""
+    best_seconds = float('inf')
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        df = fetch(query_api, query)
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+        rows = len(df)
+        del df
+
+    tracemalloc.start()
+    df = fetch(query_api, query)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+
+    return rows, best_seconds, peak_bytes, frame_bytes
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    workspace_id = sys.argv[1]
+    hours_back = int(sys.argv[2]) if len(sys.argv) > 2 else 720
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG, timeout=600_000)
+    query_api = client.query_api()
+    query = build_query(workspace_id, hours_back)
+
+    print("=" * 80)
+    print(f"Fetch benchmark: {workspace_id}, last {hours_back}h, best of {repeats}")
+    print("=" * 80)
+    print(f"{'path':<14}{'rows':>12}{'seconds':>12}{'rows/s':>14}{'peak MB':>12}{'frame MB':>12}")
+
+    try:
+        for name, fetch in [("record-loop", fetch_with_record_loop), ("columnar", fetch_columnar)]:
+            rows, seconds, peak_bytes, frame_bytes = measure(fetch, query_api, query, repeats)
+            rate = rows / seconds if seconds > 0 else 0
+            print(f"{name:<14}{rows:>12}{seconds:>12.2f}{rate:>14.0f}"
+                  f"{peak_bytes / 1e6:>12.1f}{frame_bytes / 1e6:>12.1f}")
+    finally:
+        client.close()
+
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark int8 dynamic quantization of saved PatchTST models
+For every model_* directory, compares the float32 and int8 TorchScript traces that
+export_runtime_model serves: forward latency at batch 1 and at a fleet-sized batch,
+serialized size, and the largest forecast difference on random scaled windows.
+The accuracy gate recorded at training time (runtime/runtime.json) is shown when present.
+Without saved models, a freshly initialised MODEL_CONFIG model is benchmarked.
+
+Usage: py -3.11 benchmark_quantization.py [models_dir] [batch] [threads]
+"""
+import os
+import io
+import sys
+import json
+import glob
+import time
+import torch
+from transformers import PatchTSTForPrediction
+from train_distributed import (
+    MODELS_DIR, RUNTIME_DIR, RUNTIME_META_FILE, ForecastExport, build_patchtst_config, trace_forecast,
+    quantize_forecast
+)
+
+REPEATS = 50
+
+
+def serialized_mb(module):
+    buffer = io.BytesIO()
+    torch.jit.save(module, buffer)
+    return buffer.tell() / 1e6
+
+
+def latency_ms(module, inputs):
+    with torch.no_grad():
+        for _ in range(5):
+            module(inputs)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            module(inputs)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def gate_summary(model_dir):
+    """Worst int8/float32 MAE ratio from the training-time gate, if the model was exported with one"""
+    meta_path = os.path.join(model_dir, RUNTIME_DIR, RUNTIME_META_FILE)
+    if not os.path.exists(meta_path):
+        return "-"
+    with open(meta_path) as f:
+        quantization = json.load(f).get("quantization")
+    if not quantization:
+        return "-"
+    worst = max(quantization["int8"][feature]["MAE"] / max(metrics["MAE"], 1e-12)
+                for feature, metrics in quantization["float32"].items())
+    return f"{'pass' if quantization['passed'] else 'FAIL'} {worst - 1:+.2%}"
+
+
+def main():
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else MODELS_DIR
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    torch.set_num_threads(threads)
+
+    model_dirs = sorted(d for d in glob.glob(os.path.join(models_dir, "model_*"))
+                        if os.path.exists(os.path.join(d, "config.json")))
+    if not model_dirs:
+        print(f"No saved models in {models_dir}; benchmarking an untrained MODEL_CONFIG model")
+        model_dirs = [None]
+
+    print("=" * 110)
+    print(f"int8 dynamic quantization benchmark: batch 1 and {batch}, {threads} torch threads")
+    print("=" * 110)
+    print(f"{'model':<40}{'size MB':>14}{'batch 1 ms':>16}{f'batch {batch} ms':>18}{'max |diff|':>12}{'gate':>12}")
+
+    for model_dir in model_dirs:
+        model = PatchTSTForPrediction.from_pretrained(model_dir) if model_dir else PatchTSTForPrediction(build_patchtst_config())
+        export_model = ForecastExport(model).eval()
+        int8_model = quantize_forecast(export_model)
+
+        shape = (model.config.context_length, model.config.num_input_channels)
+        float_trace = trace_forecast(export_model, torch.zeros(1, *shape))
+        int8_trace = trace_forecast(int8_model, torch.zeros(1, *shape))
+
+        single, fleet = torch.rand(1, *shape), torch.rand(batch, *shape)
+        with torch.no_grad():
+            max_diff = (float_trace(fleet) - int8_trace(fleet)).abs().max().item()
+
+        sizes = (serialized_mb(float_trace), serialized_mb(int8_trace))
+        single_ms = (latency_ms(float_trace, single), latency_ms(int8_trace, single))
+        fleet_ms = (latency_ms(float_trace, fleet), latency_ms(int8_trace, fleet))
+
+        name = os.path.basename(model_dir) if model_dir else "(untrained)"
+        print(f"{name[:39]:<40}"
+              f"{f'{sizes[0]:.2f}→{sizes[1]:.2f}':>14}"
+              f"{f'{single_ms[0]:.2f}→{single_ms[1]:.2f}':>16}"
+              f"{f'{fleet_ms[0]:.1f}→{fleet_ms[1]:.1f}':>18}"
+              f"{max_diff:>12.5f}{gate_summary(model_dir) if model_dir else '-':>12}")
+
+    print("=" * 110)
+    print("float32 → int8; serve the int8 traces with MODEL_QUANTIZED=1")
+
+
+if __name__ == "__main__":
+    main()
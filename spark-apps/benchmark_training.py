@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark training engines on the existing MODEL_CONFIG
+Trains the same PatchTST on the same synthetic windows with the default eager loop
+and with the optional engine features (torch.compile, larger batches, on-tensor metrics, bf16 autocast)
+Reports samples/second and the final validation loss for each engine
+
+Usage: py -3.11 benchmark_training.py [windows] [epochs] [threads]
+"""
+import sys
+import time
+import numpy as np
+import torch
+import train_distributed
+from train_distributed import (
+    MODEL_CONFIG, DEFAULT_ENGINE, FAST_ENGINE, SlidingWindowDataset, build_patchtst_config, fit_model
+)
+from transformers import PatchTSTForPrediction
+
+ENGINES = [
+    ("eager", DEFAULT_ENGINE),
+    ("b64", dict(DEFAULT_ENGINE, batch_size=64, tensor_metrics=True)),
+    ("bf16+b64", dict(DEFAULT_ENGINE, batch_size=64, bf16_autocast=True, tensor_metrics=True)),
+    ("fast", FAST_ENGINE),
+    ("fast+bf16", dict(FAST_ENGINE, bf16_autocast=True)),
+]
+
+
+def synthetic_dataset(windows, seed=0):
+    """Smooth multi-channel signals in [0, 1], like MinMax-scaled sensor data"""
+    rng = np.random.default_rng(seed)
+    length = windows + MODEL_CONFIG["context_length"] + MODEL_CONFIG["prediction_length"] - 1
+    t = np.arange(length)[:, None]
+    periods = rng.uniform(20, 200, size=MODEL_CONFIG["num_input_channels"])
+    series = 0.5 + 0.4 * np.sin(2 * np.pi * t / periods) + 0.05 * rng.standard_normal((length, len(periods)))
+    return SlidingWindowDataset(series, MODEL_CONFIG["context_length"], MODEL_CONFIG["prediction_length"])
+
+
+def main():
+    windows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    epochs = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    torch.set_num_threads(threads)
+
+    # Run every epoch so engines are compared on equal work
+    train_distributed.TRAINING_CONFIG["early_stopping_patience"] = epochs + 1
+
+    dataset = synthetic_dataset(windows)
+    split_idx = int(0.8 * len(dataset))
+    train_dataset = torch.utils.data.Subset(dataset, range(0, split_idx))
+    val_dataset = torch.utils.data.Subset(dataset, range(split_idx, len(dataset)))
+
+    print("=" * 80)
+    print(f"Training engine benchmark: {split_idx} train windows, {epochs} epochs, {threads} torch threads")
+    print("=" * 80)
+    print(f"{'engine':<12}{'batch':>8}{'seconds':>12}{'samples/s':>14}{'speedup':>10}{'val loss':>12}")
+
+    baseline = None
+    for name, engine in ENGINES:
+        torch.manual_seed(0)
+        model = PatchTSTForPrediction(build_patchtst_config())
+
+        start = time.perf_counter()
+        _, val_loss = fit_model(model, train_dataset, val_dataset, epochs, 1e-3, engine=engine)
+        seconds = time.perf_counter() - start
+
+        rate = epochs * split_idx / seconds
+        baseline = baseline or rate
+        print(f"{name:<12}{engine['batch_size'] * engine['accumulation_steps']:>8}{seconds:>12.1f}"
+              f"{rate:>14.0f}{rate / baseline:>9.1f}x{val_loss:>12.5f}")
+
+    print("=" * 80)
+    print("seconds include validation and, for compiled engines, torch.compile warm-up (use more epochs to amortize)")
+
+
+if __name__ == "__main__":
+    main()
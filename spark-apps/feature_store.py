@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Local Parquet feature store for training data
+Sensor data is materialized once per (workspace, UTC day) so monthly training only
+pulls days it has not seen before from InfluxDB and reads the rest from local columnar files
+
+Layout (hive style, on the /opt/spark-apps volume shared by all Spark workers):
+    feature_store/workspace_id=<quoted id>/date=YYYY-MM-DD/part.parquet
+Only complete days are stored; the current (still growing) day is always queried live, and
+the last MUTABLE_DAYS complete days are re-queried and rewritten on every run, since late
+points (e.g. the bridge's spool catching up after an outage) can still land in them.
+
+Usage: py -3.11 feature_store.py [store_dir]    # list materialized days per workspace
+"""
+import os
+import sys
+import logging
+from urllib.parse import quote, unquote
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = "/opt/spark-apps/feature_store"
+PARTITION_FILE = "part.parquet"
+MUTABLE_DAYS = 2  # complete days that ended less than this many days ago are not trusted from the store
+
+
+def day_partitions(hours_back, end=None):
+    """[start, stop) UTC day ranges covering the last hours_back hours, oldest first
+
+    The range is widened to start at midnight so every partition but the current day is a whole day.
+    """
+    end = end or datetime.now(timezone.utc)
+    day = (end - timedelta(hours=hours_back)).replace(hour=0, minute=0, second=0, microsecond=0)
+    partitions = []
+    while day < end:
+        stop = min(day + timedelta(days=1), end)
+        partitions.append((day, stop))
+        day += timedelta(days=1)
+    return partitions
+
+
+def is_complete_day(start, stop):
+    return stop - start == timedelta(days=1)
+
+
+def is_settled_day(start, stop, now=None):
+    """A complete day old enough that no late points are expected in it any more"""
+    now = now or datetime.now(timezone.utc)
+    return is_complete_day(start, stop) and stop <= now - timedelta(days=MUTABLE_DAYS)
+
+
+class FeatureStore:
+    def __init__(self, root=FEATURE_STORE_DIR):
+        self.root = root
+
+    def partition_path(self, workspace_id, day):
+        # Quote the workspace id so any character is safe in a directory name
+        return os.path.join(self.root, f"workspace_id={quote(workspace_id, safe='')}",
+                            f"date={day:%Y-%m-%d}", PARTITION_FILE)
+
+    def has_day(self, workspace_id, day):
+        return os.path.exists(self.partition_path(workspace_id, day))
+
+    def read_day(self, workspace_id, day):
+        return pd.read_parquet(self.partition_path(workspace_id, day))
+
+    def write_day(self, workspace_id, day, df):
+        """Materialize one day; written to a temp file and renamed so readers never see a partial file"""
+        path = self.partition_path(workspace_id, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def missing_days(self, workspace_id, partitions):
+        """Complete days in partitions to (re)query: not materialized yet, or not settled"""
+        return [(start, stop) for start, stop in partitions
+                if is_complete_day(start, stop)
+                and not (is_settled_day(start, stop) and self.has_day(workspace_id, start))]
+
+    def materialized(self):
+        """{workspace_id: sorted list of 'YYYY-MM-DD'} for everything in the store"""
+        result = {}
+        if not os.path.isdir(self.root):
+            return result
+        for workspace_dir in sorted(os.listdir(self.root)):
+            if not workspace_dir.startswith("workspace_id="):
+                continue
+            workspace_id = unquote(workspace_dir[len("workspace_id="):])
+            days = []
+            for date_dir in os.listdir(os.path.join(self.root, workspace_dir)):
+                if os.path.exists(os.path.join(self.root, workspace_dir, date_dir, PARTITION_FILE)):
+                    days.append(date_dir[len("date="):])
+            result[workspace_id] = sorted(days)
+        return result
+
+
+def main():
+    store = FeatureStore(sys.argv[1] if len(sys.argv) > 1 else FEATURE_STORE_DIR)
+    materialized = store.materialized()
+
+    print("=" * 80)
+    print(f"Feature store: {store.root}")
+    print("=" * 80)
+    if not materialized:
+        print("(empty)")
+    for workspace_id, days in materialized.items():
+        span = f"{days[0]} → {days[-1]}" if days else "-"
+        print(f"{workspace_id:<30}{len(days):>6} days   {span}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Decoding of raw Flux CSV responses, shared by train_distributed.py and the inference
+service's InfluxDB streamer
+
+Queries are run with header=True and no annotation rows, so the response goes straight to
+pandas' C parser instead of building a Python object per record. Tables with a different
+column set follow a blank line with their own header row; each table is parsed against its
+own header and the tables are concatenated by column name.
+"""
+import io
+import re
+import pandas as pd
+from influxdb_client import Dialect
+
+CSV_DIALECT = Dialect(header=True, annotations=[])
+TABLE_SEPARATOR = re.compile(rb"\r?\n[ \t]*\r?\n")
+
+# Tag columns keep their text: ids like "0012" or "6888e123" must not become numbers
+STRING_COLUMNS = {"workspace_id": str, "sensor_type": str}
+
+
+def read_flux_tables(query_api, query, columns):
+    """Run query and return the wanted columns of every result table as one DataFrame
+
+    Columns a table lacks are NaN for its rows; an empty response gives an empty frame
+    without a '_time' column.
+    """
+    response = query_api.query_raw(query, dialect=CSV_DIALECT)
+    try:
+        body = response.data
+    finally:
+        response.release_conn()
+
+    wanted = set(columns)
+    tables = []
+    for table in TABLE_SEPARATOR.split(body):
+        if not table.strip():
+            continue
+        try:
+            df = pd.read_csv(io.BytesIO(table), usecols=lambda column: column in wanted, dtype=STRING_COLUMNS)
+        except pd.errors.EmptyDataError:
+            continue
+        if "_time" in df and len(df):
+            tables.append(df)
+
+    if not tables:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True) if len(tables) > 1 else tables[0]
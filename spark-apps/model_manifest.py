@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Model registry manifest for trained models
+registry.json in the models directory records every saved model version per workspace
+and which version is active, so the inference service resolves a workspace's model with
+one lookup instead of scanning directories, and promotion/rollback is a manifest update.
+
+Paths are stored relative to the manifest, so the models directory can be copied as a whole.
+The Spark driver is the only writer; every update replaces the file atomically.
+
+Usage: py -3.11 model_manifest.py [models_dir] list
+       py -3.11 model_manifest.py [models_dir] promote <workspace_id> <version>
+       py -3.11 model_manifest.py [models_dir] rollback <workspace_id>
+       py -3.11 model_manifest.py [models_dir] rebuild    # register existing model_<id>_<version> directories
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "registry.json"
+MANIFEST_FORMAT = 1
+VERSION_FORMAT = "%Y%m%d_%H%M%S"     # Versions are the save timestamps in model_<id>_<version>
+MODEL_DIR_PATTERN = re.compile(r"^model_(.+)_(\d{8}_\d{6})$")
+
+
+def config_hash(config):
+    """Short stable hash of a model config dict"""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+class ModelManifest:
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+        self.path = os.path.join(models_dir, MANIFEST_FILE)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {"format": MANIFEST_FORMAT, "workspaces": {}}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write(self, manifest):
+        """Write to a temp file and rename so readers never see a partial manifest"""
+        manifest["updated_at"] = datetime.now().isoformat()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def register(self, workspace_id, version, model_dir, scaler_path=None, activate=True, **details):
+        """Record a saved model version (config_hash, metrics, ...) and make it active
+        
+        The first registration seeds the manifest with the models already on disk, so workspaces
+        this run did not retrain (skipped, failed) stay listed and keep being served.
+        """
+        if not os.path.exists(self.path):
+            self.rebuild()
+        manifest = self.load()
+        workspace = manifest["workspaces"].setdefault(workspace_id, {"active": None, "versions": {}})
+        workspace["versions"][version] = dict(
+            details,
+            model_dir=os.path.relpath(model_dir, self.models_dir),
+            scaler=os.path.relpath(scaler_path, self.models_dir) if scaler_path else None,
+            registered_at=datetime.now().isoformat()
+        )
+        if activate:
+            workspace["active"] = version
+        self._write(manifest)
+
+    def active(self, workspace_id, manifest=None):
+        """The active version's entry with absolute paths, or None"""
+        manifest = manifest or self.load()
+        workspace = manifest["workspaces"].get(workspace_id)
+        if not workspace or workspace["active"] not in workspace["versions"]:
+            return None
+        entry = dict(workspace["versions"][workspace["active"]], version=workspace["active"])
+        entry["model_dir"] = os.path.join(self.models_dir, entry["model_dir"])
+        entry["scaler"] = os.path.join(self.models_dir, entry["scaler"]) if entry["scaler"] else None
+        return entry
+
+    def promote(self, workspace_id, version):
+        manifest = self.load()
+        workspace = manifest["workspaces"].get(workspace_id)
+        if not workspace or version not in workspace["versions"]:
+            raise KeyError(f"{workspace_id} has no registered version {version}")
+        workspace["active"] = version
+        self._write(manifest)
+
+    def rollback(self, workspace_id):
+        """Activate the version registered before the active one; returns it"""
+        manifest = self.load()
+        workspace = manifest["workspaces"].get(workspace_id)
+        older = sorted(v for v in (workspace or {}).get("versions", {}) if v < (workspace["active"] or ""))
+        if not older:
+            raise KeyError(f"{workspace_id} has no version older than {workspace and workspace['active']}")
+        workspace["active"] = older[-1]
+        self._write(manifest)
+        return older[-1]
+
+    def rebuild(self):
+        """Register model_<workspace_id>_<version> directories missing from the manifest; newest becomes active"""
+        manifest = self.load()
+        added = 0
+        for name in sorted(os.listdir(self.models_dir)):
+            match = MODEL_DIR_PATTERN.match(name)
+            if not match or not os.path.isdir(os.path.join(self.models_dir, name)):
+                continue
+            workspace_id, version = match.groups()
+            workspace = manifest["workspaces"].setdefault(workspace_id, {"active": None, "versions": {}})
+            if version in workspace["versions"]:
+                continue
+            scaler = f"scaler_{workspace_id}_{version}.pkl"
+            workspace["versions"][version] = {
+                "model_dir": name,
+                "scaler": scaler if os.path.exists(os.path.join(self.models_dir, scaler)) else None,
+                "registered_at": datetime.now().isoformat()
+            }
+            workspace["active"] = max(workspace["versions"])
+            added += 1
+        self._write(manifest)
+        return added
+
+
+def main():
+    args = sys.argv[1:]
+    models_dir = "/opt/spark-apps/models"
+    if args and args[0] not in ("list", "promote", "rollback", "rebuild"):
+        models_dir = args.pop(0)
+    command = args[0] if args else "list"
+    manifest = ModelManifest(models_dir)
+
+    if command == "promote":
+        manifest.promote(args[1], args[2])
+        print(f"{args[1]}: active version is now {args[2]}")
+    elif command == "rollback":
+        print(f"{args[1]}: rolled back to {manifest.rollback(args[1])}")
+    elif command == "rebuild":
+        print(f"Registered {manifest.rebuild()} model version(s) in {manifest.path}")
+
+    print("=" * 80)
+    print(f"Model registry: {manifest.path}")
+    print("=" * 80)
+    workspaces = manifest.load()["workspaces"]
+    if not workspaces:
+        print("(empty)")
+    for workspace_id, workspace in sorted(workspaces.items()):
+        val_loss = workspace["versions"].get(workspace["active"], {}).get("metrics", {}).get("val_loss")
+        loss = f"val loss {val_loss:.6f}" if val_loss is not None else ""
+        print(f"{workspace_id:<30}active {workspace['active']}   {len(workspace['versions'])} version(s)   {loss}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter sweep for the per-workspace PatchTST models using Apache Spark
+Fans (workspace x config) trials out across executors and prunes poor trials with
+successive halving: every rung trains the surviving trials for more epochs and keeps
+the best 1/ETA per workspace. Training data is extracted once (via the feature store)
+and the normalized series plus window indexes are cached per context length, so
+trials never re-fetch or re-window data.
+
+Results go to SWEEP_DIR/<sweep_id>/leaderboard_<workspace>.json
+
+Usage: py -3.11 sweep.py [num_trials] [hours_back]
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+from urllib.parse import quote
+from datetime import datetime
+import numpy as np
+import torch
+from transformers import PatchTSTForPrediction
+import train_distributed
+from train_distributed import (
+    MODEL_CONFIG, TRAINING_CONFIG, MIN_DATA_POINTS,
+    get_spark_session, get_available_workspaces, plan_fetch_tasks, fetch_partition, assemble_workspace_data,
+    prepare_sequences, find_segments, segment_window_starts, SlidingWindowDataset,
+    build_patchtst_config, fit_model, executor_slots
+)
+
+logger = logging.getLogger(__name__)
+
+SWEEP_DIR = "/opt/spark-apps/sweeps"
+
+# Values tried per key; model keys override MODEL_CONFIG, training keys TRAINING_CONFIG
+SEARCH_SPACE = {
+    "context_length": [50, 100, 200],
+    "patch_length": [5, 10, 16],
+    "patch_stride": [2, 5, 8],
+    "d_model": [64, 128, 256],
+    "num_hidden_layers": [2, 3],
+    "learning_rate": [1e-3, 3e-4],
+}
+TRAINING_KEYS = {"learning_rate"}
+
+NUM_TRIALS = 12          # Sampled configs per workspace
+RUNG_EPOCHS = [1, 3, 9]  # Cumulative epochs a trial has trained after each rung
+ETA = 3                  # Keep the best 1/ETA of trials per workspace after each rung
+
+
+def sample_trials(num_trials, seed=0):
+    """Distinct valid configs sampled from SEARCH_SPACE"""
+    rng = random.Random(seed)
+    keys = sorted(SEARCH_SPACE)
+    total = int(np.prod([len(SEARCH_SPACE[key]) for key in keys]))
+    trials, seen = [], set()
+    for _ in range(total * 10):
+        if len(trials) >= num_trials:
+            break
+        config = {key: rng.choice(SEARCH_SPACE[key]) for key in keys}
+        if config["patch_stride"] > config["patch_length"] or config["patch_length"] > config["context_length"]:
+            continue
+        if config["d_model"] % MODEL_CONFIG["num_attention_heads"]:
+            continue
+        signature = tuple(config[key] for key in keys)
+        if signature in seen:
+            continue
+        seen.add(signature)
+        trials.append(dict(config, trial_id=len(trials)))
+    return trials
+
+
+def workspace_dir(sweep_dir, kind, workspace_id):
+    return os.path.join(sweep_dir, kind, quote(workspace_id, safe=''))
+
+
+def prepare_workspace_cache(task):
+    """Extract one workspace and cache its normalized series and window starts per context length - executed on Spark worker
+
+    The scaler is fitted on the whole series, so the normalized series is shared by all
+    context lengths; only the valid window start index differs.
+    """
+    workspace_id = task['workspace_id']
+    partitions = [fetch_partition(fetch_task)[1] for fetch_task in task['fetch_tasks']]
+    df = assemble_workspace_data(workspace_id, partitions)['data'].sort_values('time').reset_index(drop=True)
+    if len(df) < MIN_DATA_POINTS:
+        return {'workspace_id': workspace_id, 'records': len(df), 'windows': {}}
+
+    prediction_length = MODEL_CONFIG["prediction_length"]
+    dataset, _ = prepare_sequences(df, MODEL_CONFIG["context_length"], prediction_length)
+    segments = find_segments(df['time'])
+
+    cache_dir = workspace_dir(task['sweep_dir'], 'cache', workspace_id)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, 'series.npy'), dataset.series)
+
+    windows = {}
+    for context_length in task['context_lengths']:
+        starts = segment_window_starts(segments, context_length + prediction_length)
+        np.save(os.path.join(cache_dir, f'starts_{context_length}.npy'), starts)
+        windows[context_length] = len(starts)
+
+    return {'workspace_id': workspace_id, 'records': len(df), 'windows': windows}
+
+
+def run_trial(task):
+    """Train one (workspace, config) trial up to its rung's epoch budget - executed on Spark worker
+
+    Continues from the trial's checkpoint of the previous rung (model weights only;
+    the optimizer restarts each rung) and returns the best validation loss. The checkpoint
+    keeps that best epoch's weights, so the next rung and the winner start from what was ranked.
+    """
+    if task.get('torch_threads'):
+        torch.set_num_threads(task['torch_threads'])
+
+    workspace_id, trial = task['workspace_id'], task['trial']
+    context_length = trial['context_length']
+    started = time.perf_counter()
+
+    try:
+        # Memory-mapped cache: windows are views, nothing is re-fetched or re-windowed
+        cache_dir = workspace_dir(task['sweep_dir'], 'cache', workspace_id)
+        series = np.load(os.path.join(cache_dir, 'series.npy'), mmap_mode='r')
+        starts = np.load(os.path.join(cache_dir, f'starts_{context_length}.npy'))
+        dataset = SlidingWindowDataset(series, context_length, MODEL_CONFIG["prediction_length"], starts=starts)
+        if len(dataset) < 2:
+            raise ValueError(f"only {len(dataset)} windows at context_length {context_length}")
+
+        split_idx = int(0.8 * len(dataset))
+        train_dataset = torch.utils.data.Subset(dataset, range(0, split_idx))
+        val_dataset = torch.utils.data.Subset(dataset, range(split_idx, len(dataset)))
+
+        model_overrides = {key: value for key, value in trial.items() if key in MODEL_CONFIG}
+        model = PatchTSTForPrediction(build_patchtst_config(**model_overrides))
+
+        checkpoint_dir = workspace_dir(task['sweep_dir'], 'checkpoints', workspace_id)
+        checkpoint_path = os.path.join(checkpoint_dir, f"trial_{trial['trial_id']}.pt")
+        if task['epochs_done'] and os.path.exists(checkpoint_path):
+            model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+
+        learning_rate = trial.get('learning_rate', TRAINING_CONFIG["learning_rate"])
+        train_loss, val_loss = fit_model(model, train_dataset, val_dataset,
+                                         task['epochs'] - task['epochs_done'], learning_rate, restore_best=True)
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        torch.save(model.state_dict(), checkpoint_path)
+
+        return {'workspace_id': workspace_id, 'trial_id': trial['trial_id'], 'status': 'success',
+                'val_loss': val_loss, 'train_loss': train_loss, 'epochs': task['epochs'],
+                'windows': len(dataset), 'seconds': time.perf_counter() - started}
+
+    except Exception as e:
+        return {'workspace_id': workspace_id, 'trial_id': trial['trial_id'], 'status': 'failed',
+                'error': str(e), 'val_loss': float('inf'), 'epochs': task['epochs_done'],
+                'seconds': time.perf_counter() - started}
+
+
+def write_leaderboard(sweep_dir, workspace_id, trials, history):
+    """Trials ranked by the val loss of the furthest rung they reached"""
+    entries = []
+    for trial in trials:
+        result = history.get((workspace_id, trial['trial_id']))
+        if result is None:
+            continue
+        entries.append({
+            'trial_id': trial['trial_id'],
+            'config': {key: value for key, value in trial.items() if key != 'trial_id'},
+            'status': result['status'],
+            'epochs': result['epochs'],
+            'val_loss': result['val_loss'] if np.isfinite(result['val_loss']) else None,
+            'train_loss': result.get('train_loss'),
+            'error': result.get('error')
+        })
+    entries.sort(key=lambda e: (-e['epochs'], e['val_loss'] if e['val_loss'] is not None else float('inf')))
+
+    path = os.path.join(sweep_dir, f"leaderboard_{quote(workspace_id, safe='')}.json")
+    with open(path, 'w') as f:
+        json.dump({'workspace_id': workspace_id, 'rung_epochs': RUNG_EPOCHS, 'eta': ETA, 'trials': entries}, f, indent=2)
+    return path, entries
+
+
+def run_sweep(spark, workspaces, num_trials=NUM_TRIALS, hours_back=720):
+    """Successive-halving sweep over sampled configs for every workspace"""
+    sc = spark.sparkContext
+    sweep_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sweep_dir = os.path.join(SWEEP_DIR, sweep_id)
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    trials = sample_trials(num_trials)
+    context_lengths = sorted({trial['context_length'] for trial in trials})
+    with open(os.path.join(sweep_dir, 'trials.json'), 'w') as f:
+        json.dump({'search_space': SEARCH_SPACE, 'trials': trials}, f, indent=2)
+
+    logger.info("=" * 80)
+    logger.info(f"🔬 Sweep {sweep_id}: {len(trials)} configs x {len(workspaces)} workspaces, "
+                f"rungs {RUNG_EPOCHS} epochs, keep 1/{ETA}")
+    logger.info("=" * 80)
+
+    # Extract once per workspace and cache the windows for every context length in the sweep
+    fetch_tasks = plan_fetch_tasks(workspaces, hours_back)
+    cache_tasks = [{'workspace_id': w, 'sweep_dir': sweep_dir, 'context_lengths': context_lengths,
+                    'fetch_tasks': [t for t in fetch_tasks if t['workspace_id'] == w]} for w in workspaces]
+    cached = sc.parallelize(cache_tasks, len(cache_tasks)).map(prepare_workspace_cache).collect()
+    ready = [c['workspace_id'] for c in cached if c['windows']]
+    for c in cached:
+        logger.info(f"   📦 {c['workspace_id']}: {c['records']} records, windows per context length {c['windows']}")
+
+    slots, task_cpus = executor_slots(sc)
+    survivors = {w: list(trials) for w in ready}
+    history = {}  # {(workspace_id, trial_id): latest result}
+    epochs_done = 0
+
+    for rung, epochs in enumerate(RUNG_EPOCHS):
+        rung_tasks = [{'workspace_id': w, 'trial': trial, 'epochs_done': epochs_done, 'epochs': epochs,
+                       'sweep_dir': sweep_dir, 'torch_threads': task_cpus}
+                      for w, workspace_trials in survivors.items() for trial in workspace_trials]
+        if not rung_tasks:
+            break
+
+        logger.info(f"🏃 Rung {rung + 1}/{len(RUNG_EPOCHS)}: {len(rung_tasks)} trials to {epochs} epochs on {slots} slots")
+        started = time.perf_counter()
+        results = sc.parallelize(rung_tasks, len(rung_tasks)).map(run_trial).collect()
+        for result in results:
+            history[(result['workspace_id'], result['trial_id'])] = result
+        logger.info(f"   ⏱️  Rung {rung + 1} took {time.perf_counter() - started:.1f}s")
+
+        # Keep the best 1/ETA per workspace (at least one) for the next rung
+        if rung + 1 < len(RUNG_EPOCHS):
+            for w, workspace_trials in survivors.items():
+                ranked = sorted(workspace_trials, key=lambda t: history[(w, t['trial_id'])]['val_loss'])
+                ranked = [t for t in ranked if np.isfinite(history[(w, t['trial_id'])]['val_loss'])]
+                survivors[w] = ranked[:max(1, len(ranked) // ETA)]
+        epochs_done = epochs
+
+    logger.info("=" * 80)
+    logger.info("🏆 Sweep leaderboards:")
+    logger.info("=" * 80)
+    for w in ready:
+        path, entries = write_leaderboard(sweep_dir, w, trials, history)
+        best = entries[0] if entries else None
+        if best and best['val_loss'] is not None:
+            logger.info(f"   {w}: best val loss {best['val_loss']:.6f} after {best['epochs']} epochs - {best['config']}")
+        else:
+            logger.info(f"   {w}: no successful trials")
+        logger.info(f"      {path}")
+    logger.info("=" * 80)
+
+    return sweep_dir
+
+
+def main():
+    num_trials = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_TRIALS
+    hours_back = int(sys.argv[2]) if len(sys.argv) > 2 else 720
+
+    spark = get_spark_session()
+    # Executors unpickle references to train_distributed's functions
+    spark.sparkContext.addPyFile(train_distributed.__file__)
+
+    try:
+        workspaces = get_available_workspaces(hours_back=hours_back)
+        if not workspaces:
+            logger.warning("⚠️  No workspaces found with data")
+            return
+        run_sweep(spark, workspaces, num_trials, hours_back)
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,18 +6,29 @@ Uses HuggingFace PatchTST implementation matching the research notebook
 """
 import sys
 import os
+import re
+import json
+import pickle
 import logging
-from datetime import datetime, timedelta
+import warnings
+import itertools
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
+from numpy.lib.stride_tricks import sliding_window_view
 from pyspark.sql import SparkSession
-from pyspark import SparkConf
+from pyspark import SparkConf, StorageLevel
 from influxdb_client import InfluxDBClient
 from transformers import PatchTSTConfig, PatchTSTForPrediction
 from sklearn.preprocessing import MinMaxScaler
+from feature_store import FeatureStore, FEATURE_STORE_DIR, day_partitions, is_complete_day, is_settled_day
+from model_manifest import ModelManifest, config_hash, VERSION_FORMAT
+from flux_csv import read_flux_tables
 
 # Configure logging
 logging.basicConfig(
@@ -58,9 +69,68 @@ TRAINING_CONFIG = {
     "early_stopping_patience": 2
 }
 
+# Training engine used by fit_model; the default reproduces the original eager float32 loop
+DEFAULT_ENGINE = {
+    "batch_size": TRAINING_CONFIG["batch_size"],
+    "accumulation_steps": 1,         # Micro-batches per optimizer step
+    "bf16_autocast": False,
+    "compile": False,                # torch.compile the model (falls back to eager if unsupported)
+    "tensor_metrics": False,         # Keep losses on-tensor instead of a loss.item() sync per batch
+}
+# bf16 autocast only pays off on CPUs with native bf16 matmul; check with benchmark_training.py first
+FAST_ENGINE = dict(DEFAULT_ENGINE, batch_size=64, compile=True, tensor_metrics=True)
+TRAINING_ENGINE = FAST_ENGINE if '--fast-engine' in sys.argv else DEFAULT_ENGINE
+
+# Warm start: fine-tune the workspace's latest model on data newer than it, instead of training from scratch
+INCREMENTAL_TRAINING = '--full' not in sys.argv   # Pass --full to force training from scratch
+FINETUNE_CONFIG = {
+    "num_epochs": 2,
+    "learning_rate": 1e-4,           # 10x lower than from-scratch training
+}
+SCALER_DRIFT_THRESHOLD = 0.10        # Retrain from scratch if new data leaves the old scaler range by >10% of it
+
+MODELS_DIR = "/opt/spark-apps/models"
+TRAINING_INFO_FILE = "training_info.json"   # Data range the model was trained on, saved next to its weights
+
+# Global mode: one shared model for all workspaces instead of one per workspace
+GLOBAL_TRAINING = '--global' in sys.argv     # Pass --global to train the shared model
+GLOBAL_MODEL_ID = "global"                   # Saved as model_global_{timestamp} / scaler_global_{timestamp}.pkl
+GLOBAL_WORKSPACE_EMBEDDING = True            # Learn a per-workspace input offset (index 0 = unseen workspace)
+GLOBAL_UNSEEN_DROPOUT = 0.1                  # Share of training windows shown as "unseen workspace"
+WORKSPACE_EMBEDDING_FILE = "workspace_embedding.pt"
+
+# Serving artifacts exported next to each saved model for the inference service's runtime backend
+RUNTIME_EXPORT = True
+RUNTIME_DIR = "runtime"                      # model_dir/runtime/
+RUNTIME_META_FILE = "runtime.json"           # Shapes, feature order and the scaler folded to scale/min arrays
+TORCHSCRIPT_FILE = "model.torchscript.pt"
+ONNX_FILE = "model.onnx"                     # Only exported when the onnx package is installed
+
+# Post-training dynamic quantization (encoder Linear layers to int8) of the exported TorchScript model
+QUANTIZE_EXPORT = True
+TORCHSCRIPT_INT8_FILE = "model.int8.torchscript.pt"
+QUANTIZATION_TOLERANCE = 0.02                # int8 may be at most 2% worse than float32 on each feature's MAE and RMSE
+QUANTIZATION_GATE_WINDOWS = 256              # Held-out validation windows the gate compares forecasts on
+
+# Data-parallel training of the largest workspaces across several executors (torch DDP over gloo, Spark barrier mode)
+DDP_ENABLED = True
+DDP_MIN_RECORDS = 1_000_000      # ~23 days at the 2-second sampling rate
+DDP_MAX_RANKS = 4                # Ranks per workspace, capped by the cluster's task slots
+DDP_TIMEOUT_MINUTES = 10         # A rank waiting longer than this on its peers fails the job instead of hanging
+
 # Minimum data points required per workspace to train (context + prediction)
 MIN_DATA_POINTS = 60  # Just need enough for context_length (50) + some extra
 
+# Readings further apart than this are treated as machine downtime; windows never span the gap
+MAX_SAMPLE_GAP_SECONDS = 10  # 5x the 2-second sampling interval
+
+# Training data is extracted as one Spark task per (workspace, UTC day)
+EXTRACT_MAX_RETRIES = 3          # Attempts per partition before it is left out
+FEATURE_STORE_ENABLED = True     # Read complete days from the local Parquet store, query only new ones
+
+# Sensor channels, in model input order
+FEATURE_COLUMNS = ['current', 'accX', 'accY', 'accZ', 'tempA', 'tempB']
+
 class SimplePatchTST(nn.Module):
     """
     HuggingFace PatchTST wrapper for compatibility
@@ -68,6 +138,97 @@ class SimplePatchTST(nn.Module):
     """
     pass  # Not used - using transformers.PatchTSTForPrediction instead
 
+class SlidingWindowDataset(Dataset):
+    """
+    Lazy (context, target) windows over one normalized series
+    Windows are strided views into the series, so memory stays O(series length);
+    each item is only copied when the DataLoader collates a batch.
+    `starts` lists the valid window start rows (all of them if None)
+    """
+    def __init__(self, series, context_length, prediction_length, starts=None):
+        self.series = np.ascontiguousarray(series, dtype=np.float32)
+        self.context_length = context_length
+        self.prediction_length = prediction_length
+        self.contexts, self.targets = build_window_views(self.series, context_length, prediction_length)
+        self.starts = np.arange(len(self.contexts)) if starts is None else np.asarray(starts, dtype=np.int64)
+        self.segments = []  # [{"start", "end", "rows", "windows"}], filled by prepare_sequences
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __getitem__(self, idx):
+        start = self.starts[idx]
+        return torch.from_numpy(np.array(self.contexts[start])), torch.from_numpy(np.array(self.targets[start]))
+
+class WorkspaceTaggedDataset(Dataset):
+    """Adds a constant workspace index to every (context, target) item of a dataset"""
+    def __init__(self, dataset, workspace_index):
+        self.dataset = dataset
+        self.workspace_index = torch.tensor(workspace_index, dtype=torch.long)
+    
+    def __len__(self):
+        return len(self.dataset)
+    
+    def __getitem__(self, idx):
+        context, target = self.dataset[idx]
+        return context, target, self.workspace_index
+
+class WorkspaceConditionedModel(nn.Module):
+    """
+    PatchTST with a learned per-workspace offset added to its scaled input
+    Row 0 of the embedding stands for an unseen workspace; during training a share of
+    windows is routed to it so the shared model also serves new machines
+    """
+    def __init__(self, model, num_workspaces, unseen_dropout=GLOBAL_UNSEEN_DROPOUT):
+        super().__init__()
+        self.model = model
+        self.config = model.config
+        self.unseen_dropout = unseen_dropout
+        self.workspace_bias = nn.Embedding(num_workspaces + 1, model.config.num_input_channels)
+        nn.init.zeros_(self.workspace_bias.weight)
+    
+    def forward(self, past_values, future_values=None, workspace_index=None):
+        if workspace_index is not None:
+            if self.training and self.unseen_dropout > 0:
+                unseen = torch.rand(workspace_index.shape, device=workspace_index.device) < self.unseen_dropout
+                workspace_index = workspace_index.masked_fill(unseen, 0)
+            past_values = past_values + self.workspace_bias(workspace_index).unsqueeze(1)
+        return self.model(past_values=past_values, future_values=future_values)
+
+class ForecastExport(nn.Module):
+    """past_values -> prediction_outputs only, the fixed-shape forward the service needs; traced for export"""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, past_values):
+        return self.model(past_values=past_values).prediction_outputs
+
+def build_window_views(series, context_length, prediction_length):
+    """Zero-copy (N, context_length, C) and (N, prediction_length, C) views of every sliding window"""
+    total_length = context_length + prediction_length
+    if len(series) < total_length:
+        empty = series[:0]
+        return empty.reshape(0, context_length, series.shape[1]), empty.reshape(0, prediction_length, series.shape[1])
+    
+    # sliding_window_view puts the window axis last: (N, C, total) -> (N, total, C), still a view
+    windows = sliding_window_view(series, total_length, axis=0).transpose(0, 2, 1)
+    return windows[:, :context_length], windows[:, context_length:]
+
+def find_segments(times, max_gap_seconds=MAX_SAMPLE_GAP_SECONDS):
+    """[(start_row, end_row)) ranges of a sorted time column, split wherever a gap exceeds max_gap_seconds"""
+    if len(times) == 0:
+        return []
+    seconds = (times - times.iloc[0]).dt.total_seconds().to_numpy()
+    breaks = np.flatnonzero(np.diff(seconds) > max_gap_seconds) + 1
+    bounds = np.concatenate(([0], breaks, [len(times)]))
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def segment_window_starts(segments, total_length):
+    """Start rows of every window that fits entirely inside one segment"""
+    starts = [np.arange(start, end - total_length + 1) for start, end in segments if end - start >= total_length]
+    return np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+
 def get_spark_session():
     """Initialize Spark session with proper configuration"""
     logger.info("🔧 Initializing Spark session...")
@@ -96,6 +257,11 @@ def get_spark_session():
         .config(conf=conf) \
         .getOrCreate()
     
+    # Ship sibling modules imported by executor-side code
+    spark.sparkContext.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "feature_store.py"))
+    spark.sparkContext.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_manifest.py"))
+    spark.sparkContext.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "flux_csv.py"))
+    
     logger.info(f"   ✅ Spark session initialized: {spark.sparkContext.master}")
     logger.info(f"   ✅ Spark version: {spark.version}")
     logger.info(f"   ✅ Available executors: {len(spark.sparkContext._jsc.sc().statusTracker().getExecutorInfos()) - 1}")
@@ -133,52 +299,118 @@ def get_available_workspaces(hours_back=1):
     logger.info(f"✅ Found {len(workspaces)} workspaces: {workspaces}")
     return workspaces
 
-def load_workspace_data(workspace_id, hours_back=2):
-    """Load sensor data for a specific workspace from InfluxDB (reduced to 2 hours for testing)"""
+def read_feature_frame(query_api, query):
+    """Run a pivoted Flux query and decode the CSV response column-wise.
+    
+    Returns a DataFrame with a UTC 'time' column and float32 feature columns,
+    without building a Python object per record.
+    """
+    df = read_flux_tables(query_api, query, ['_time'] + FEATURE_COLUMNS)
+    if df.empty:
+        return pd.DataFrame(columns=['time'] + FEATURE_COLUMNS)
+    
+    # Flux drops trailing zeros from fractional seconds, so the format varies per row
+    frame = pd.DataFrame({'time': pd.to_datetime(df['_time'], utc=True, format='ISO8601')})
+    for feature in FEATURE_COLUMNS:
+        if feature in df:
+            frame[feature] = df[feature].astype(np.float32)
+        else:
+            frame[feature] = np.float32(0)
+    
+    return frame.reset_index(drop=True)
+
+def load_workspace_data(workspace_id, hours_back=2, start=None, stop=None):
+    """Load sensor data for a specific workspace from InfluxDB (reduced to 2 hours for testing)
+    
+    With start/stop (UTC datetimes) only that time partition is loaded instead of the last hours_back hours.
+    """
     client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
     query_api = client.query_api()
     
+    if start is not None and stop is not None:
+        time_range = f'start: time(v: "{start.isoformat()}"), stop: time(v: "{stop.isoformat()}")'
+    else:
+        time_range = f'start: -{hours_back}h'
+    
     # Query to get data for specific workspace
     query = f'''
     from(bucket: "{INFLUXDB_BUCKET}")
-        |> range(start: -{hours_back}h)
+        |> range({time_range})
         |> filter(fn: (r) => r._measurement == "sensor_data")
         |> filter(fn: (r) => r.workspace_id == "{workspace_id}")
         |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
     '''
     
-    result = query_api.query(query=query)
-    
-    # Convert to pandas DataFrame
-    records = []
-    for table in result:
-        for record in table.records:
-            records.append({
-                'time': record.get_time(),
-                'current': float(record.values.get('current', 0)),
-                'accX': float(record.values.get('accX', 0)),
-                'accY': float(record.values.get('accY', 0)),
-                'accZ': float(record.values.get('accZ', 0)),
-                'tempA': float(record.values.get('tempA', 0)),
-                'tempB': float(record.values.get('tempB', 0))
-            })
-    
-    df = pd.DataFrame(records)
-    client.close()
+    try:
+        df = read_feature_frame(query_api, query)
+    finally:
+        client.close()
     
     return df
 
-def prepare_sequences(df, context_length, prediction_length):
+def fetch_partition(task):
+    """Load one (workspace, day) - executed on Spark worker
+    
+    Settled days already in the feature store are read locally; others are queried from
+    InfluxDB, and complete days are (re)materialized so later runs can read them once settled.
+    Retries inside the task, so a failed partition is re-fetched on its own
+    without re-running the rest of the workspace's extraction.
+    Returns (workspace_id, {'start', 'stop', 'source', 'data' | 'error'}).
+    """
+    import time
+    
+    workspace_id, start, stop = task['workspace_id'], task['start'], task['stop']
+    store = FeatureStore(task['store_dir']) if task.get('store_dir') else None
+    
+    if store and is_settled_day(start, stop) and store.has_day(workspace_id, start):
+        try:
+            return workspace_id, {'start': start, 'stop': stop, 'source': 'store', 'data': store.read_day(workspace_id, start)}
+        except Exception as e:
+            logger.warning(f"⚠️  {workspace_id} {start:%Y-%m-%d}: unreadable store partition, re-fetching: {e}")
+    
+    for attempt in range(1, EXTRACT_MAX_RETRIES + 1):
+        try:
+            df = load_workspace_data(workspace_id, start=start, stop=stop)
+            if store and is_complete_day(start, stop):
+                store.write_day(workspace_id, start, df)
+            return workspace_id, {'start': start, 'stop': stop, 'source': 'influx', 'data': df}
+        except Exception as e:
+            logger.warning(f"⚠️  {workspace_id} partition {start:%Y-%m-%d %H:%M} failed "
+                           f"(attempt {attempt}/{EXTRACT_MAX_RETRIES}): {e}")
+            if attempt == EXTRACT_MAX_RETRIES:
+                return workspace_id, {'start': start, 'stop': stop, 'error': str(e)}
+            time.sleep(2 ** attempt)
+
+def assemble_workspace_data(workspace_id, partitions):
+    """Concatenate a workspace's fetched partitions into one time-ordered frame for training"""
+    partitions = sorted(partitions, key=lambda p: p['start'])
+    frames = [p['data'] for p in partitions if 'data' in p and len(p['data'])]
+    failed = [p['start'].isoformat() for p in partitions if 'error' in p]
+    from_store = sum(1 for p in partitions if p.get('source') == 'store')
+    logger.info(f"   📦 {workspace_id}: {from_store} days from feature store, "
+                f"{len(partitions) - from_store - len(failed)} from InfluxDB")
+    
+    if frames:
+        df = pd.concat(frames, ignore_index=True).sort_values('time').reset_index(drop=True)
+    else:
+        df = pd.DataFrame(columns=['time'] + FEATURE_COLUMNS)
+    
+    return {'workspace_id': workspace_id, 'data': df, 'failed_partitions': failed}
+
+def prepare_sequences(df, context_length, prediction_length, scaler=None):
     """Prepare sliding window sequences for training using MinMaxScaler (matching notebook)
     
-    Handles sparse data: Only creates sequences from continuous data blocks.
-    If machine is down (no data), those time periods are automatically excluded.
+    A fitted scaler (from the model being fine-tuned) is reused as-is instead of fitting a new one.
+    
+    Handles sparse data: the series is split into contiguous segments wherever
+    consecutive readings are more than MAX_SAMPLE_GAP_SECONDS apart (machine downtime),
+    and windows are only built inside a segment, never across a gap.
     """
     # Sort by time
     df = df.sort_values('time').reset_index(drop=True)
     
     # Extract features (current, accX, accY, accZ, tempA, tempB)
-    features = df[['current', 'accX', 'accY', 'accZ', 'tempA', 'tempB']].values
+    features = df[FEATURE_COLUMNS].values
     
     # Handle NaN values - replace with feature mean (matching notebook approach)
     for i in range(features.shape[1]):
@@ -188,22 +420,414 @@ def prepare_sequences(df, context_length, prediction_length):
             features[:, i] = np.nan_to_num(feature_col, nan=feature_mean)
     
     # Normalize features using MinMaxScaler (matching notebook)
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    features_normalized = scaler.fit_transform(features)
+    if scaler is None:
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        features_normalized = scaler.fit_transform(features)
+    else:
+        features_normalized = scaler.transform(features)
     
-    # Create sequences (sliding window)
-    # Note: Only creates sequences from available data points
-    # Machine downtime (missing data) naturally creates fewer sequences
-    X, y = [], []
+    # Split at downtime gaps and index the windows that fit inside a segment
     total_length = context_length + prediction_length
+    segments = find_segments(df['time'])
+    starts = segment_window_starts(segments, total_length)
+    
+    # Create sequences (sliding window) as lazy views over the normalized series
+    dataset = SlidingWindowDataset(features_normalized, context_length, prediction_length, starts=starts)
+    dataset.segments = [{
+        'start': df['time'].iloc[start],
+        'end': df['time'].iloc[end - 1],
+        'rows': end - start,
+        'windows': max(0, end - start - total_length + 1)
+    } for start, end in segments]
+    
+    return dataset, scaler
+
+def log_segment_report(segments, max_lines=20):
+    """Log how many windows each contiguous segment contributed"""
+    useful = [segment for segment in segments if segment['windows'] > 0]
+    short_rows = sum(segment['rows'] for segment in segments if segment['windows'] == 0)
+    logger.info(f"   🧩 {len(segments)} contiguous segments, {len(useful)} long enough for a window "
+                f"({short_rows} rows in shorter segments unused)")
+    for segment in sorted(useful, key=lambda s: s['windows'], reverse=True)[:max_lines]:
+        logger.info(f"      {segment['start']} → {segment['end']}: {segment['rows']} rows, {segment['windows']} windows")
+    if len(useful) > max_lines:
+        logger.info(f"      ... {len(useful) - max_lines} more segments")
+
+def find_latest_model(workspace_id, models_dir=None):
+    """(model_dir, scaler_path, trained_at) of the workspace's active model, or None
+    
+    The registry manifest's active version wins, so a rollback also moves the warm-start base.
+    Without a manifest entry, the newest model_{workspace_id}_{YYYYmmdd_HHMMSS} on disk is used,
+    matched in full so ids containing underscores (or sharing a prefix) resolve correctly.
+    """
+    models_dir = models_dir or MODELS_DIR
+    if not os.path.isdir(models_dir):
+        return None
+    active = ModelManifest(models_dir).active(workspace_id)
+    if active and active['scaler'] and os.path.isdir(active['model_dir']) and os.path.exists(active['scaler']):
+        return active['model_dir'], active['scaler'], datetime.strptime(active['version'], VERSION_FORMAT)
+    pattern = re.compile(rf"^model_{re.escape(workspace_id)}_(\d{{8}}_\d{{6}})$")
+    candidates = []
+    for name in os.listdir(models_dir):
+        match = pattern.match(name)
+        if match:
+            scaler_path = os.path.join(models_dir, f"scaler_{workspace_id}_{match.group(1)}.pkl")
+            if os.path.exists(scaler_path):
+                candidates.append((match.group(1), os.path.join(models_dir, name), scaler_path))
+    if not candidates:
+        return None
+    timestamp, model_dir, scaler_path = max(candidates)
+    return model_dir, scaler_path, datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+
+def model_data_end(model_dir, trained_at):
+    """UTC time of the newest reading the model was trained on (falls back to its save time)"""
+    try:
+        with open(os.path.join(model_dir, TRAINING_INFO_FILE)) as f:
+            return pd.Timestamp(json.load(f)['data_end'])
+    except (OSError, KeyError, ValueError):
+        # Directory timestamps are local time
+        return pd.Timestamp(trained_at.astimezone(timezone.utc))
+
+def config_matches(config):
+    """True if a saved PatchTSTConfig has the architecture MODEL_CONFIG would build now"""
+    return all(getattr(config, key, None) == value for key, value in MODEL_CONFIG.items())
+
+def scaler_drift(scaler, df):
+    """Largest distance, per feature, that df extends beyond the scaler's fitted range (as a fraction of that range)"""
+    values = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    fitted_range = np.where(scaler.data_range_ > 0, scaler.data_range_, 1.0)
+    below = np.clip(scaler.data_min_ - np.nanmin(values, axis=0), 0, None)
+    above = np.clip(np.nanmax(values, axis=0) - scaler.data_max_, 0, None)
+    return float(np.max((below + above) / fitted_range))
+
+def load_warm_start(workspace_id, df):
+    """Decide between fine-tuning the latest model and training from scratch
+    
+    Returns (model, scaler, data, info): model/scaler are None for a full training run;
+    data is the part of df to train on; info describes the decision for the result/log.
+    """
+    latest = find_latest_model(workspace_id) if INCREMENTAL_TRAINING else None
+    if latest is None:
+        return None, None, df, {'mode': 'full', 'reason': 'no_previous_model' if INCREMENTAL_TRAINING else 'forced'}
+    
+    model_dir, scaler_path, trained_at = latest
+    info = {'base_model': model_dir}
+    
+    config = PatchTSTConfig.from_pretrained(model_dir)
+    if not config_matches(config):
+        return None, None, df, dict(info, mode='full', reason='config_changed')
+    
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    
+    data_end = model_data_end(model_dir, trained_at)
+    df = df.sort_values('time').reset_index(drop=True)
+    first_new = int(df['time'].searchsorted(data_end, side='right'))
+    if first_new == len(df):
+        return None, None, df.iloc[:0], dict(info, mode='fine_tune', reason='up_to_date')
+    
+    # Keep one context of older rows so the first new readings can be forecast targets
+    new_data = df.iloc[max(0, first_new - MODEL_CONFIG["context_length"]):].reset_index(drop=True)
+    
+    drift = scaler_drift(scaler, df.iloc[first_new:])
+    info['scaler_drift'] = round(drift, 4)
+    if drift > SCALER_DRIFT_THRESHOLD:
+        return None, None, df, dict(info, mode='full', reason='scaler_drift')
+    
+    model = PatchTSTForPrediction.from_pretrained(model_dir)
+    return model, scaler, new_data, dict(info, mode='fine_tune', reason='new_data', data_after=data_end.isoformat())
+
+def build_patchtst_config(**overrides):
+    """PatchTSTConfig for MODEL_CONFIG, with any MODEL_CONFIG keys overridden (used by sweep.py)"""
+    model_config = dict(MODEL_CONFIG, **overrides)
+    return PatchTSTConfig(
+        context_length=model_config["context_length"],
+        prediction_length=model_config["prediction_length"],
+        num_attention_heads=model_config["num_attention_heads"],
+        num_input_channels=model_config["num_input_channels"],
+        num_targets=model_config["num_targets"],
+        num_hidden_layers=model_config["num_hidden_layers"],
+        patch_length=model_config["patch_length"],
+        patch_stride=model_config["patch_stride"],
+        d_model=model_config["d_model"],
+        ffn_dim=model_config["ffn_dim"],
+        dropout=model_config["dropout"],
+        loss=model_config["loss"],
+        scaling=model_config["scaling"]
+    )
+
+def trace_forecast(export_model, example):
+    
+    # PatchTST's shape checks trigger TracerWarnings; the traced graph still generalizes over batch size
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return torch.jit.trace(export_model, example, check_trace=False)
+
+def quantize_forecast(export_model):
+    """int8 dynamic quantization of the Linear layers inside the Transformer encoder layers
+    
+    The patch embedding and forecast head stay float32: they are tiny, and quantizing them costs most of the accuracy.
+    """
+    layers = {name for name, module in export_model.named_modules()
+              if isinstance(module, nn.Linear) and '.encoder.layers.' in name}
+    return torch.ao.quantization.quantize_dynamic(export_model, layers, dtype=torch.qint8)
+
+def holdout_windows(dataset, max_windows, workspace_bias=None):
+    """The last max_windows (context, target) pairs of a validation dataset as two batched tensors
+    
+    Items tagged with a workspace index (global model) get that workspace's learned input offset.
+    """
+    items = [dataset[i] for i in range(max(0, len(dataset) - max_windows), len(dataset))]
+    contexts = torch.stack([item[0] for item in items])
+    targets = torch.stack([item[1] for item in items])
+    if workspace_bias is not None and len(items[0]) > 2:
+        with torch.no_grad():
+            contexts = contexts + workspace_bias(torch.stack([item[2] for item in items])).unsqueeze(1)
+    return contexts, targets
+
+def forecast_metrics(predictions, targets):
+    """Per-feature MAE and RMSE on scaled values, as InferenceService.validate_model reports them"""
+    errors = predictions - targets
+    return {feature: {'MAE': float(errors[..., i].abs().mean()), 'RMSE': float(errors[..., i].pow(2).mean().sqrt())}
+            for i, feature in enumerate(FEATURE_COLUMNS)}
+
+def quantization_gate(float_model, int8_model, holdout):
+    """Pass if int8 forecasts are within QUANTIZATION_TOLERANCE of float32 on every feature's MAE and RMSE"""
+    contexts, targets = holdout
+    with torch.no_grad():
+        float_metrics = forecast_metrics(float_model(contexts), targets)
+        int8_metrics = forecast_metrics(int8_model(contexts), targets)
+    passed = all(int8_metrics[feature][metric] <= float_metrics[feature][metric] * (1 + QUANTIZATION_TOLERANCE) + 1e-6
+                 for feature in FEATURE_COLUMNS for metric in ('MAE', 'RMSE'))
+    return {'passed': passed, 'tolerance': QUANTIZATION_TOLERANCE, 'windows': len(contexts),
+            'float32': float_metrics, 'int8': int8_metrics}
+
+def export_runtime_model(model, model_dir, scalers, holdout=None):
+    """Export a trained PatchTST for serving without transformers
+    
+    Writes model_dir/runtime/ with a TorchScript trace, an ONNX graph when onnx is installed,
+    and runtime.json holding each workspace's MinMaxScaler as scale/min arrays
+    (scaled = raw * scale + min). With holdout windows, an int8 dynamic-quantized trace is
+    added if it passes quantization_gate. Returns the exported formats; failures only log a warning.
+    """
+    runtime_dir = os.path.join(model_dir, RUNTIME_DIR)
+    os.makedirs(runtime_dir, exist_ok=True)
+    
+    export_model = ForecastExport(model.to('cpu')).eval()
+    example = torch.zeros(1, model.config.context_length, model.config.num_input_channels)
+    files = {}
+    quantization = None
+    
+    try:
+        torch.jit.save(trace_forecast(export_model, example), os.path.join(runtime_dir, TORCHSCRIPT_FILE))
+        files['torchscript'] = TORCHSCRIPT_FILE
+    except Exception as e:
+        logger.warning(f"   ⚠️ TorchScript export failed: {e}")
+    
+    if QUANTIZE_EXPORT and holdout is not None:
+        try:
+            int8_model = quantize_forecast(export_model)
+            quantization = quantization_gate(export_model, int8_model, holdout)
+            if quantization['passed']:
+                torch.jit.save(trace_forecast(int8_model, example), os.path.join(runtime_dir, TORCHSCRIPT_INT8_FILE))
+                files['torchscript_int8'] = TORCHSCRIPT_INT8_FILE
+            else:
+                logger.warning(f"   ⚠️ int8 model failed the accuracy gate (>{QUANTIZATION_TOLERANCE:.0%} worse), not exported")
+        except Exception as e:
+            logger.warning(f"   ⚠️ int8 quantization failed: {e}")
+    
+    import importlib.util
+    if importlib.util.find_spec("onnx") is not None:
+        try:
+            torch.onnx.export(export_model, (example,), os.path.join(runtime_dir, ONNX_FILE),
+                              input_names=['past_values'], output_names=['prediction_outputs'],
+                              dynamic_axes={'past_values': {0: 'batch'}, 'prediction_outputs': {0: 'batch'}})
+            files['onnx'] = ONNX_FILE
+        except Exception as e:
+            logger.warning(f"   ⚠️ ONNX export failed: {e}")
+    
+    with open(os.path.join(runtime_dir, RUNTIME_META_FILE), 'w') as f:
+        json.dump({
+            'context_length': model.config.context_length,
+            'prediction_length': model.config.prediction_length,
+            'num_input_channels': model.config.num_input_channels,
+            'features': FEATURE_COLUMNS,
+            'files': files,
+            'quantization': quantization,
+            'scalers': {workspace_id: {'scale': scaler.scale_.tolist(), 'min': scaler.min_.tolist()}
+                        for workspace_id, scaler in scalers.items()}
+        }, f, indent=2)
+    
+    logger.info(f"✅ Runtime export: {', '.join(files) or 'none'} → {runtime_dir}")
+    return list(files)
+
+def unpack_batch(batch, device):
+    """(past, future, extra model kwargs) from a (X, y) or (X, y, workspace_index) batch"""
+    batch_X, batch_y = batch[0].to(device), batch[1].to(device)
+    if len(batch) > 2:
+        return batch_X, batch_y, {'workspace_index': batch[2].to(device)}
+    return batch_X, batch_y, {}
+
+def fit_model(model, train_dataset, val_dataset, num_epochs, learning_rate, rank=0, world_size=1, engine=None,
+              restore_best=False):
+    """Train with early stopping on val_dataset; returns (final train loss, best val loss)
+    
+    With world_size > 1 the torch.distributed process group must already be initialized.
+    engine overrides TRAINING_ENGINE (see DEFAULT_ENGINE for the options).
+    restore_best: leave the model with the best-val-loss epoch's weights instead of the last epoch's.
+    """
+    engine = dict(DEFAULT_ENGINE, **(engine or TRAINING_ENGINE))
+    batch_size = engine["batch_size"]
+    accumulation_steps = max(1, engine["accumulation_steps"])
+    tensor_metrics = engine["tensor_metrics"]
+    
+    # Setup device
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    logger.info(f"   🔧 Using device: {device}")
+    
+    # Under DDP (process group already initialized) each rank trains on its own shard of windows
+    distributed = world_size > 1
+    train_model = torch.nn.parallel.DistributedDataParallel(model) if distributed else model
+    if distributed:
+        logger.info(f"   🔗 DDP rank {rank}/{world_size}")
+    
+    # Optional engine features: bf16 autocast and a compiled forward
+    autocast = torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=engine["bf16_autocast"])
+    forward = train_model
+    if engine["compile"] and hasattr(torch, "compile"):
+        forward = torch.compile(train_model)
+    if engine != DEFAULT_ENGINE:
+        logger.info(f"   ⚡ Engine: batch {batch_size} x {accumulation_steps} accumulation, "
+                    f"bf16={engine['bf16_autocast']}, compiled={forward is not train_model}")
+    
+    # Define loss and optimizer (matching notebook)
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+    
+    # Training loop with early stopping
+    model.train()
+    best_val_loss = float('inf')
+    best_state = None
+    early_stop_counter = 0
+    train_losses = []
+    
+    if distributed:
+        train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True)
+        val_sampler = DistributedSampler(val_dataset, num_replicas=world_size, rank=rank, shuffle=False)
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=train_sampler)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, sampler=val_sampler)
+    else:
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size)
+    
+    # Every rank must run the same number of steps, or a gradient all-reduce waits on a rank that
+    # already finished its epoch; if ranks ended up with different data, all train the shortest epoch
+    train_steps = len(train_loader)
+    if distributed:
+        steps = torch.tensor([train_steps])
+        torch.distributed.all_reduce(steps, op=torch.distributed.ReduceOp.MIN)
+        if steps.item() != train_steps:
+            logger.warning(f"   ⚠️ Rank {rank} has {train_steps} batches per epoch, training {steps.item()} to match the other ranks")
+        train_steps = steps.item()
+    
+    for epoch in range(num_epochs):
+        if distributed:
+            train_sampler.set_epoch(epoch)
+        
+        # Training phase
+        epoch_loss = torch.zeros((), device=device) if tensor_metrics else 0
+        optimizer.zero_grad()
+        for step, batch in enumerate(itertools.islice(train_loader, train_steps)):
+            batch_X, batch_y, conditioning = unpack_batch(batch, device)
+            
+            with autocast:
+                try:
+                    outputs = forward(past_values=batch_X, future_values=batch_y, **conditioning)
+                except Exception as e:
+                    # torch.compile fails lazily on the first call for unsupported models/platforms
+                    if forward is train_model:
+                        raise
+                    logger.warning(f"   ⚠️ torch.compile unavailable ({type(e).__name__}), continuing in eager mode")
+                    forward = train_model
+                    outputs = forward(past_values=batch_X, future_values=batch_y, **conditioning)
+            loss = outputs.loss.float()
+            
+            # Check for NaN loss (all ranks skip the step together, or gradient sync would hang).
+            # With tensor metrics the check moves to the gradient norm, once per optimizer step.
+            if not tensor_metrics:
+                nan_loss = torch.isnan(loss).float()
+                if distributed:
+                    torch.distributed.all_reduce(nan_loss)
+                if nan_loss.item() > 0:
+                    logger.warning(f"   ⚠️ NaN loss detected at epoch {epoch+1}")
+                    continue
+            
+            (loss / accumulation_steps).backward()
+            
+            if (step + 1) % accumulation_steps == 0 or step + 1 == train_steps:
+                # Gradient clipping (matching notebook)
+                grad_norm = torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=TRAINING_CONFIG["max_grad_norm"])
+                # Gradients are identical on every rank after DDP's all-reduce, so all ranks agree here
+                if tensor_metrics and not torch.isfinite(grad_norm):
+                    logger.warning(f"   ⚠️ Non-finite gradients at epoch {epoch+1}, skipping step")
+                else:
+                    optimizer.step()
+                optimizer.zero_grad()
+            
+            if tensor_metrics:
+                epoch_loss += torch.nan_to_num(loss.detach(), nan=0.0)
+            else:
+                epoch_loss += loss.item()
+        
+        if tensor_metrics:
+            epoch_loss = epoch_loss.item()
+        avg_train_loss = epoch_loss / train_steps if train_steps > 0 else 0
+        train_losses.append(avg_train_loss)
+        
+        # Validation phase
+        model.eval()
+        val_loss = torch.zeros((), device=device) if tensor_metrics else 0.0
+        with torch.no_grad(), autocast:
+            for batch in val_loader:
+                batch_X, batch_y, conditioning = unpack_batch(batch, device)
+                outputs = model(past_values=batch_X, future_values=batch_y, **conditioning)
+                preds = outputs.prediction_outputs if outputs.prediction_outputs is not None else outputs.logits
+                loss = criterion(preds.float(), batch_y)
+                val_loss += loss.detach() if tensor_metrics else loss.item()
+        
+        if tensor_metrics:
+            val_loss = val_loss.item()
+        avg_val_loss = val_loss / len(val_loader) if len(val_loader) > 0 else 0
+        
+        # Average losses over all ranks so every rank makes the same early-stopping decision
+        if distributed:
+            losses = torch.tensor([avg_train_loss, avg_val_loss], dtype=torch.float64)
+            torch.distributed.all_reduce(losses)
+            avg_train_loss, avg_val_loss = (losses / world_size).tolist()
+            train_losses[-1] = avg_train_loss
+        
+        if (epoch + 1) % 5 == 0:
+            logger.info(f"   Epoch {epoch+1}/{num_epochs}, Train Loss: {avg_train_loss:.6f}, Val Loss: {avg_val_loss:.6f}")
+        
+        # Early stopping check
+        if avg_val_loss < best_val_loss:
+            best_val_loss = avg_val_loss
+            early_stop_counter = 0
+            if restore_best:
+                best_state = {key: value.detach().clone() for key, value in model.state_dict().items()}
+        else:
+            early_stop_counter += 1
+            if early_stop_counter >= TRAINING_CONFIG["early_stopping_patience"]:
+                logger.info(f"   🛑 Early stopping triggered at epoch {epoch+1}")
+                break
+        
+        model.train()
     
-    for i in range(len(features_normalized) - total_length + 1):
-        context = features_normalized[i:i + context_length]
-        target = features_normalized[i + context_length:i + total_length]
-        X.append(context)
-        y.append(target)
+    if best_state is not None:
+        model.load_state_dict(best_state)
     
-    return np.array(X), np.array(y), scaler
+    return avg_train_loss, best_val_loss
 
 def train_workspace_model(workspace_info):
     """Train model for a single workspace using HuggingFace PatchTST - executed on Spark worker"""
@@ -211,7 +835,7 @@ def train_workspace_model(workspace_info):
     import logging
     import torch
     import torch.nn as nn
-    from torch.utils.data import DataLoader, TensorDataset
+    from torch.utils.data import DataLoader
     from transformers import PatchTSTConfig, PatchTSTForPrediction
     import numpy as np
     from datetime import datetime
@@ -220,140 +844,97 @@ def train_workspace_model(workspace_info):
     
     logger = logging.getLogger(__name__)
     
+    # Match torch's intra-op threads to the cores Spark reserved for this task
+    if workspace_info.get('torch_threads'):
+        torch.set_num_threads(workspace_info['torch_threads'])
+    
     workspace_id = workspace_info['workspace_id']
-    hours_back = workspace_info['hours_back']
+    hours_back = workspace_info.get('hours_back', 2)
+    failed_partitions = workspace_info.get('failed_partitions', [])
     
     try:
         logger.info(f"🎯 Training PatchTST model for workspace: {workspace_id}")
         
-        # Load data
-        df = load_workspace_data(workspace_id, hours_back)
+        # Use the data extracted by the partitioned fetch stage, or load it here
+        df = workspace_info.get('data')
+        if df is None:
+            df = load_workspace_data(workspace_id, hours_back)
+        if failed_partitions:
+            logger.warning(f"⚠️  {workspace_id}: training without {len(failed_partitions)} failed partitions")
+        
+        logger.info(f"   📊 Loaded {len(df)} records for {workspace_id}")
+        
+        # Warm start from the latest model when its config and scaler still fit
+        model, base_scaler, df, warm_start = load_warm_start(workspace_id, df)
+        if warm_start['reason'] == 'up_to_date':
+            logger.info(f"   ⏭️  Skipping {workspace_id}: no data newer than the current model")
+            return {'workspace_id': workspace_id, 'status': 'skipped', 'reason': 'up_to_date', 'records': 0}
+        
+        if warm_start['mode'] == 'fine_tune':
+            logger.info(f"   ♻️  Fine-tuning {os.path.basename(warm_start['base_model'])} on {len(df)} new records "
+                        f"(scaler drift {warm_start.get('scaler_drift', 0):.1%})")
+        elif 'base_model' in warm_start:
+            logger.info(f"   🔁 Full training: {warm_start['reason']} "
+                        f"(previous model {os.path.basename(warm_start['base_model'])})")
         
         if len(df) < MIN_DATA_POINTS:
             logger.warning(f"⚠️  Skipping {workspace_id}: Only {len(df)} records (need {MIN_DATA_POINTS})")
             return {'workspace_id': workspace_id, 'status': 'skipped', 'reason': 'insufficient_data', 'records': len(df)}
         
-        logger.info(f"   📊 Loaded {len(df)} records for {workspace_id}")
-        
         # Prepare sequences
-        X, y, scaler = prepare_sequences(df, MODEL_CONFIG["context_length"], MODEL_CONFIG["prediction_length"])
+        dataset, scaler = prepare_sequences(df, MODEL_CONFIG["context_length"], MODEL_CONFIG["prediction_length"],
+                                            scaler=base_scaler)
         
-        if len(X) == 0:
+        if len(dataset) == 0:
             logger.warning(f"⚠️  Skipping {workspace_id}: No sequences generated")
             return {'workspace_id': workspace_id, 'status': 'skipped', 'reason': 'no_sequences', 'records': len(df)}
         
-        logger.info(f"   📊 Created {len(X)} training sequences")
-        
-        # Convert to PyTorch tensors
-        X_tensor = torch.FloatTensor(X)
-        y_tensor = torch.FloatTensor(y)
-        
-        # Create DataLoader
-        dataset = TensorDataset(X_tensor, y_tensor)
-        dataloader = DataLoader(dataset, batch_size=TRAINING_CONFIG["batch_size"], shuffle=True)
-        
-        # Initialize HuggingFace PatchTST model
-        config = PatchTSTConfig(
-            context_length=MODEL_CONFIG["context_length"],
-            prediction_length=MODEL_CONFIG["prediction_length"],
-            num_attention_heads=MODEL_CONFIG["num_attention_heads"],
-            num_input_channels=MODEL_CONFIG["num_input_channels"],
-            num_targets=MODEL_CONFIG["num_targets"],
-            num_hidden_layers=MODEL_CONFIG["num_hidden_layers"],
-            patch_length=MODEL_CONFIG["patch_length"],
-            patch_stride=MODEL_CONFIG["patch_stride"],
-            d_model=MODEL_CONFIG["d_model"],
-            ffn_dim=MODEL_CONFIG["ffn_dim"],
-            dropout=MODEL_CONFIG["dropout"],
-            loss=MODEL_CONFIG["loss"],
-            scaling=MODEL_CONFIG["scaling"]
-        )
-        model = PatchTSTForPrediction(config)
+        logger.info(f"   📊 Created {len(dataset)} training sequences")
+        log_segment_report(dataset.segments)
         
-        # Setup device
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model.to(device)
-        logger.info(f"   🔧 Using device: {device}")
+        # Initialize HuggingFace PatchTST model (unless fine-tuning a previous one)
+        config = model.config if model is not None else build_patchtst_config()
+        if model is None:
+            model = PatchTSTForPrediction(config)
         
-        # Define loss and optimizer (matching notebook)
-        criterion = nn.MSELoss()
-        optimizer = torch.optim.AdamW(model.parameters(), lr=TRAINING_CONFIG["learning_rate"])
+        # Fine-tuning runs fewer, gentler epochs
+        num_epochs = FINETUNE_CONFIG["num_epochs"] if warm_start['mode'] == 'fine_tune' else TRAINING_CONFIG["num_epochs"]
+        learning_rate = FINETUNE_CONFIG["learning_rate"] if warm_start['mode'] == 'fine_tune' else TRAINING_CONFIG["learning_rate"]
         
-        # Training loop with early stopping
-        model.train()
-        best_val_loss = float('inf')
-        early_stop_counter = 0
-        train_losses = []
+        # Under DDP (process group set up by train_workspace_ddp) each rank trains on its own shard of windows
+        rank = workspace_info.get('rank', 0)
+        world_size = workspace_info.get('world_size', 1)
         
         # Split data for validation (80/20 split)
         split_idx = int(0.8 * len(dataset))
         train_dataset = torch.utils.data.Subset(dataset, range(0, split_idx))
         val_dataset = torch.utils.data.Subset(dataset, range(split_idx, len(dataset)))
         
-        train_loader = DataLoader(train_dataset, batch_size=TRAINING_CONFIG["batch_size"], shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=TRAINING_CONFIG["batch_size"])
+        avg_train_loss, best_val_loss = fit_model(model, train_dataset, val_dataset, num_epochs, learning_rate,
+                                                  rank=rank, world_size=world_size)
         
-        for epoch in range(TRAINING_CONFIG["num_epochs"]):
-            # Training phase
-            epoch_loss = 0
-            for batch_X, batch_y in train_loader:
-                batch_X, batch_y = batch_X.to(device), batch_y.to(device)
-                
-                optimizer.zero_grad()
-                outputs = model(past_values=batch_X, future_values=batch_y)
-                loss = outputs.loss
-                
-                # Check for NaN loss
-                if torch.isnan(loss):
-                    logger.warning(f"   ⚠️ NaN loss detected at epoch {epoch+1}")
-                    continue
-                
-                loss.backward()
-                # Gradient clipping (matching notebook)
-                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=TRAINING_CONFIG["max_grad_norm"])
-                optimizer.step()
-                
-                epoch_loss += loss.item()
-            
-            avg_train_loss = epoch_loss / len(train_loader) if len(train_loader) > 0 else 0
-            train_losses.append(avg_train_loss)
-            
-            # Validation phase
-            model.eval()
-            val_loss = 0.0
-            with torch.no_grad():
-                for batch_X, batch_y in val_loader:
-                    batch_X, batch_y = batch_X.to(device), batch_y.to(device)
-                    outputs = model(past_values=batch_X, future_values=batch_y)
-                    preds = outputs.prediction_outputs if outputs.prediction_outputs is not None else outputs.logits
-                    loss = criterion(preds, batch_y)
-                    val_loss += loss.item()
-            
-            avg_val_loss = val_loss / len(val_loader) if len(val_loader) > 0 else 0
-            
-            if (epoch + 1) % 5 == 0:
-                logger.info(f"   Epoch {epoch+1}/{TRAINING_CONFIG['num_epochs']}, Train Loss: {avg_train_loss:.6f}, Val Loss: {avg_val_loss:.6f}")
-            
-            # Early stopping check
-            if avg_val_loss < best_val_loss:
-                best_val_loss = avg_val_loss
-                early_stop_counter = 0
-            else:
-                early_stop_counter += 1
-                if early_stop_counter >= TRAINING_CONFIG["early_stopping_patience"]:
-                    logger.info(f"   🛑 Early stopping triggered at epoch {epoch+1}")
-                    break
-            
-            model.train()
+        # Only rank 0 saves the (identical) DDP replica
+        if rank != 0:
+            return {'workspace_id': workspace_id, 'status': 'success', 'rank': rank}
         
         # Save model
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        model_dir = f"/opt/spark-apps/models/model_{workspace_id}_{timestamp}"
-        scaler_path = f"/opt/spark-apps/models/scaler_{workspace_id}_{timestamp}.pkl"
+        model_dir = f"{MODELS_DIR}/model_{workspace_id}_{timestamp}"
+        scaler_path = f"{MODELS_DIR}/scaler_{workspace_id}_{timestamp}.pkl"
         
         # Save HuggingFace model
         model.save_pretrained(model_dir)
         
+        # Record the data range so the next run fine-tunes only on newer data
+        with open(os.path.join(model_dir, TRAINING_INFO_FILE), 'w') as f:
+            json.dump({
+                'data_start': df['time'].min().isoformat(),
+                'data_end': df['time'].max().isoformat(),
+                'records': len(df),
+                'mode': warm_start['mode'],
+                'base_model': warm_start.get('base_model')
+            }, f, indent=2)
+        
         # Save scaler
         import pickle
         with open(scaler_path, 'wb') as f:
@@ -362,13 +943,26 @@ def train_workspace_model(workspace_info):
         logger.info(f"✅ Model saved: {model_dir}")
         logger.info(f"✅ Scaler saved: {scaler_path}")
         
+        runtime_formats = []
+        if RUNTIME_EXPORT:
+            holdout = holdout_windows(val_dataset, QUANTIZATION_GATE_WINDOWS) if len(val_dataset) else None
+            runtime_formats = export_runtime_model(model, model_dir, {workspace_id: scaler}, holdout)
+        
         return {
             'workspace_id': workspace_id,
             'status': 'success',
             'records': len(df),
-            'sequences': len(X),
+            'sequences': len(dataset),
+            'segments': len(dataset.segments),
+            'failed_partitions': failed_partitions,
+            'mode': warm_start['mode'],
+            'ranks': world_size,
+            'base_model': warm_start.get('base_model'),
+            'version': timestamp,
+            'config_hash': config_hash(MODEL_CONFIG),
             'model_path': model_dir,
             'scaler_path': scaler_path,
+            'runtime_formats': runtime_formats,
             'final_train_loss': avg_train_loss,
             'final_val_loss': best_val_loss
         }
@@ -379,18 +973,273 @@ def train_workspace_model(workspace_info):
         logger.error(traceback.format_exc())
         return {'workspace_id': workspace_id, 'status': 'failed', 'error': str(e)}
 
+def plan_fetch_tasks(workspaces, hours_back):
+    """One extraction task per (workspace, day) so large ranges fetch in parallel across executors"""
+    partitions = day_partitions(hours_back)
+    store_dir = FEATURE_STORE_DIR if FEATURE_STORE_ENABLED else None
+    fetch_tasks = [{'workspace_id': w, 'start': start, 'stop': stop, 'store_dir': store_dir}
+                   for w in workspaces for start, stop in partitions]
+    logger.info(f"📥 Extracting {len(fetch_tasks)} partitions ({len(partitions)} days per workspace)")
+    
+    # Incremental sync: only days not materialized yet, recent days and the current day go to InfluxDB
+    if store_dir:
+        store = FeatureStore(store_dir)
+        missing = sum(len(store.missing_days(w, partitions)) for w in workspaces)
+        cached = sum(1 for w in workspaces for start, stop in partitions
+                     if is_settled_day(start, stop) and store.has_day(w, start))
+        logger.info(f"📦 Feature store {store_dir}: {cached} days cached, "
+                    f"{missing} new or recent days + {len(workspaces)} current-day partitions to query")
+    
+    return fetch_tasks
+
+def train_global_model(partitions, workspaces, torch_threads=None, rank=0, world_size=1):
+    """Train one PatchTST shared by all workspaces - executed on Spark worker(s)
+    
+    partitions maps each workspace to its already fetched partitions, so every DDP rank
+    trains on the same frames without querying InfluxDB itself.
+    Each workspace keeps its own MinMaxScaler and chronological 80/20 split; the windows of
+    all workspaces are then trained on together, optionally conditioned on the workspace.
+    """
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    
+    try:
+        train_parts, val_parts, scalers, trained = [], [], {}, []
+        records = 0
+        for workspace_id in workspaces:
+            df = assemble_workspace_data(workspace_id, partitions.get(workspace_id, []))['data']
+            if len(df) < MIN_DATA_POINTS:
+                logger.warning(f"⚠️  Leaving out {workspace_id}: Only {len(df)} records (need {MIN_DATA_POINTS})")
+                continue
+            
+            dataset, scaler = prepare_sequences(df, MODEL_CONFIG["context_length"], MODEL_CONFIG["prediction_length"])
+            if len(dataset) == 0:
+                logger.warning(f"⚠️  Leaving out {workspace_id}: No sequences generated")
+                continue
+            
+            # Index 0 is reserved for unseen workspaces
+            tagged = WorkspaceTaggedDataset(dataset, len(trained) + 1)
+            split_idx = int(0.8 * len(dataset))
+            train_parts.append(torch.utils.data.Subset(tagged, range(0, split_idx)))
+            val_parts.append(torch.utils.data.Subset(tagged, range(split_idx, len(dataset))))
+            scalers[workspace_id] = scaler
+            trained.append(workspace_id)
+            records += len(df)
+        
+        if not trained:
+            return {'workspace_id': GLOBAL_MODEL_ID, 'status': 'skipped', 'reason': 'insufficient_data', 'records': records}
+        
+        train_dataset = torch.utils.data.ConcatDataset(train_parts)
+        val_dataset = torch.utils.data.ConcatDataset(val_parts)
+        logger.info(f"   🌐 Global model: {len(trained)} workspaces, {records} records, "
+                    f"{len(train_dataset) + len(val_dataset)} training sequences")
+        
+        model = PatchTSTForPrediction(build_patchtst_config())
+        if GLOBAL_WORKSPACE_EMBEDDING:
+            model = WorkspaceConditionedModel(model, len(trained))
+        
+        avg_train_loss, best_val_loss = fit_model(model, train_dataset, val_dataset, TRAINING_CONFIG["num_epochs"],
+                                                  TRAINING_CONFIG["learning_rate"], rank=rank, world_size=world_size)
+        
+        # Only rank 0 saves the (identical) DDP replica
+        if rank != 0:
+            return {'workspace_id': GLOBAL_MODEL_ID, 'status': 'success', 'rank': rank}
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        model_dir = f"{MODELS_DIR}/model_{GLOBAL_MODEL_ID}_{timestamp}"
+        scaler_path = f"{MODELS_DIR}/scaler_{GLOBAL_MODEL_ID}_{timestamp}.pkl"
+        
+        # The PatchTST itself is a plain HuggingFace model; the workspace offsets are saved beside it
+        base_model = model.model if GLOBAL_WORKSPACE_EMBEDDING else model
+        base_model.save_pretrained(model_dir)
+        if GLOBAL_WORKSPACE_EMBEDDING:
+            torch.save({
+                'workspace_ids': trained,
+                'weight': model.workspace_bias.weight.detach().cpu()
+            }, os.path.join(model_dir, WORKSPACE_EMBEDDING_FILE))
+        
+        # One scaler per workspace, keyed by workspace id
+        with open(scaler_path, 'wb') as f:
+            pickle.dump(scalers, f)
+        
+        with open(os.path.join(model_dir, TRAINING_INFO_FILE), 'w') as f:
+            json.dump({'mode': 'global', 'workspaces': trained, 'records': records}, f, indent=2)
+        
+        logger.info(f"✅ Global model saved: {model_dir}")
+        logger.info(f"✅ Scalers saved: {scaler_path}")
+        
+        # Workspace offsets stay in WORKSPACE_EMBEDDING_FILE; the service adds them to the scaled input
+        runtime_formats = []
+        if RUNTIME_EXPORT:
+            model.to('cpu')
+            holdout = holdout_windows(val_dataset, QUANTIZATION_GATE_WINDOWS,
+                                      model.workspace_bias if GLOBAL_WORKSPACE_EMBEDDING else None) if len(val_dataset) else None
+            runtime_formats = export_runtime_model(base_model, model_dir, scalers, holdout)
+        
+        return {
+            'workspace_id': GLOBAL_MODEL_ID,
+            'status': 'success',
+            'records': records,
+            'sequences': len(train_dataset) + len(val_dataset),
+            'workspaces': trained,
+            'ranks': world_size,
+            'version': timestamp,
+            'config_hash': config_hash(MODEL_CONFIG),
+            'model_path': model_dir,
+            'scaler_path': scaler_path,
+            'runtime_formats': runtime_formats,
+            'final_train_loss': avg_train_loss,
+            'final_val_loss': best_val_loss
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ Error training global model: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return {'workspace_id': GLOBAL_MODEL_ID, 'status': 'failed', 'error': str(e)}
+
+def register_model(result):
+    """Record a saved model in the registry manifest as its workspace's active version (driver only)"""
+    if result.get('status') != 'success' or not result.get('model_path'):
+        return
+    try:
+        ModelManifest(MODELS_DIR).register(
+            result['workspace_id'], result['version'], result['model_path'], result.get('scaler_path'),
+            config_hash=result['config_hash'],
+            metrics={'train_loss': result.get('final_train_loss'), 'val_loss': result.get('final_val_loss')},
+            records=result.get('records'),
+            mode=result.get('mode', 'global' if result['workspace_id'] == GLOBAL_MODEL_ID else 'full'),
+            base_model=result.get('base_model'),
+            runtime_formats=result.get('runtime_formats', [])
+        )
+        logger.info(f"   🗂️  {result['workspace_id']}: version {result['version']} is now active")
+    except Exception as e:
+        logger.warning(f"   ⚠️ Could not register {result['workspace_id']} in the model manifest: {e}")
+
+def run_ddp(sc, world_size, train_fn):
+    """Run train_fn(rank, world_size) on world_size Spark barrier tasks inside a gloo process group
+    
+    Returns rank 0's return value.
+    """
+    def run_rank(_):
+        import socket
+        import torch.distributed as dist
+        from pyspark import BarrierTaskContext
+        
+        context = BarrierTaskContext.get()
+        rank = context.partitionId()
+        
+        # Rank 0 picks a free port; all ranks rendezvous at rank 0's host
+        port = 0
+        if rank == 0:
+            with socket.socket() as sock:
+                sock.bind(('', 0))
+                port = sock.getsockname()[1]
+        ports = context.allGather(str(port))
+        os.environ['MASTER_ADDR'] = context.getTaskInfos()[0].address.split(':')[0]
+        os.environ['MASTER_PORT'] = ports[0]
+        
+        dist.init_process_group('gloo', rank=rank, world_size=world_size,
+                                timeout=timedelta(minutes=DDP_TIMEOUT_MINUTES))
+        try:
+            result = train_fn(rank, world_size)
+        finally:
+            dist.destroy_process_group()
+        return [result] if rank == 0 else []
+    
+    return sc.parallelize(range(world_size), world_size).barrier().mapPartitions(run_rank).collect()[0]
+
+def train_workspace_ddp(sc, workspace_info, partitions, world_size):
+    """Train one workspace with torch DDP across world_size Spark barrier tasks
+    
+    partitions are the workspace's already fetched partitions. They are broadcast so every
+    rank trains on the same frame (a live query per rank could see late points), so scaler
+    and windows agree; DistributedSampler then gives each rank its own shard of the windows.
+    Returns rank 0's training result.
+    """
+    shared = sc.broadcast(partitions)
+    
+    def train_rank(rank, world_size):
+        data = assemble_workspace_data(workspace_info['workspace_id'], shared.value)
+        return train_workspace_model(dict(workspace_info, **data, rank=rank, world_size=world_size))
+    
+    try:
+        return run_ddp(sc, world_size, train_rank)
+    finally:
+        shared.unpersist()
+
+def executor_slots(sc):
+    """(concurrent training tasks the cluster can run, cores reserved per task)"""
+    task_cpus = int(sc.getConf().get("spark.task.cpus", "1"))
+    return max(1, sc.defaultParallelism // task_cpus), task_cpus
+
 def train_all_workspaces_distributed(spark, workspaces, hours_back=720):
     """Train models for all workspaces using Spark distributed processing"""
     logger.info("=" * 80)
     logger.info(f"🚀 Starting distributed training for {len(workspaces)} workspaces (using {hours_back/24:.1f} days of data)")
     logger.info("=" * 80)
     
-    # Prepare workspace data for distribution
-    workspace_data = [{'workspace_id': w, 'hours_back': hours_back} for w in workspaces]
+    fetch_tasks = plan_fetch_tasks(workspaces, hours_back)
     
-    # Distribute training across Spark workers using RDD
-    workspace_rdd = spark.sparkContext.parallelize(workspace_data, len(workspaces))
-    results = workspace_rdd.map(train_workspace_model).collect()
+    sc = spark.sparkContext
+    fetched = sc.parallelize(fetch_tasks, len(fetch_tasks)) \
+        .map(fetch_partition) \
+        .persist(StorageLevel.MEMORY_AND_DISK)
+    
+    try:
+        # Estimate each workspace's training cost from its record count
+        costs = fetched.map(lambda item: (item[0], len(item[1].get('data', ())))) \
+            .reduceByKey(lambda a, b: a + b) \
+            .collectAsMap()
+        slots, task_cpus = executor_slots(sc)
+        order = sorted(workspaces, key=lambda w: costs.get(w, 0), reverse=True)
+        logger.info(f"🗂️  Scheduling {len(order)} workspaces longest-first on {slots} slots "
+                    f"({task_cpus} torch threads each), largest: "
+                    + ", ".join(f"{w} ({costs.get(w, 0)} records)" for w in order[:3]))
+        
+        # The largest workspaces train one at a time with DDP across the whole cluster
+        ddp_workspaces = [w for w in order if DDP_ENABLED and slots > 1 and costs.get(w, 0) >= DDP_MIN_RECORDS]
+        order = [w for w in order if w not in ddp_workspaces]
+        results = []
+        for workspace_id in ddp_workspaces:
+            world_size = min(DDP_MAX_RANKS, slots)
+            logger.info(f"   🔗 {workspace_id}: DDP training on {world_size} ranks ({costs[workspace_id]} records)")
+            try:
+                partitions = fetched.filter(lambda item, w=workspace_id: item[0] == w).values().collect()
+                result = train_workspace_ddp(sc, {'workspace_id': workspace_id, 'hours_back': hours_back,
+                                                  'torch_threads': task_cpus},
+                                             partitions, world_size)
+            except Exception as e:
+                result = {'workspace_id': workspace_id, 'status': 'failed', 'error': str(e)}
+            results.append(result)
+            logger.info(f"   📬 [{len(results)}/{len(workspaces)}] {workspace_id}: {result['status']}")
+            register_model(result)
+        
+        # Gather each workspace's partitions into its own Spark partition: partition i holds workspaces[i].
+        # The partitioner goes to groupByKey itself; its default hash partitioner would reshuffle the keys
+        workspace_index = {w: i for i, w in enumerate(workspaces)}
+        training = fetched \
+            .groupByKey(len(workspaces), lambda w: workspace_index[w]) \
+            .map(lambda item: dict(assemble_workspace_data(item[0], item[1]), torch_threads=task_cpus)) \
+            .map(train_workspace_model)
+        
+        # One Spark job per workspace, submitted longest-first as slots free up, so the biggest
+        # workspace starts first instead of becoming the straggler; results are logged as they land
+        with ThreadPoolExecutor(max_workers=slots) as pool:
+            futures = {pool.submit(sc.runJob, training, list, [workspace_index[w]]): w for w in order}
+            for future in as_completed(futures):
+                workspace_id = futures[future]
+                try:
+                    result = future.result()[0]
+                    if result['workspace_id'] != workspace_id:
+                        raise RuntimeError(f"partition {workspace_index[workspace_id]} trained {result['workspace_id']}")
+                except Exception as e:
+                    result = {'workspace_id': workspace_id, 'status': 'failed', 'error': str(e)}
+                results.append(result)
+                logger.info(f"   📬 [{len(results)}/{len(workspaces)}] {workspace_id}: {result['status']}")
+                register_model(result)
+    finally:
+        fetched.unpersist()
     
     # Summary
     logger.info("=" * 80)
@@ -408,7 +1257,9 @@ def train_all_workspaces_distributed(spark, workspaces, hours_back=720):
     
     for result in results:
         if result['status'] == 'success':
-            logger.info(f"   ✅ {result['workspace_id']}: {result['sequences']} sequences, {result['records']} records")
+            logger.info(f"   ✅ {result['workspace_id']}: {result['sequences']} sequences, {result['records']} records ({result.get('mode', 'full')})")
+            if result.get('failed_partitions'):
+                logger.info(f"      ⚠️  missing partitions: {', '.join(result['failed_partitions'])}")
         elif result['status'] == 'skipped':
             logger.info(f"   ⚠️  {result['workspace_id']}: {result.get('reason', 'unknown')} ({result.get('records', 0)} records)")
         else:
@@ -418,6 +1269,54 @@ def train_all_workspaces_distributed(spark, workspaces, hours_back=720):
     
     return results
 
+def train_global_distributed(spark, workspaces, hours_back=720):
+    """Train one model shared by all workspaces (--global)"""
+    logger.info("=" * 80)
+    logger.info(f"🌐 Starting global model training over {len(workspaces)} workspaces (using {hours_back/24:.1f} days of data)")
+    logger.info("=" * 80)
+    
+    sc = spark.sparkContext
+    fetch_tasks = plan_fetch_tasks(workspaces, hours_back)
+    
+    # Fetch every (workspace, day) partition once, in parallel (fetch_partition also fills the
+    # feature store), then broadcast them so the trainer task(s) never query InfluxDB themselves
+    partitions = sc.parallelize(fetch_tasks, len(fetch_tasks)) \
+        .map(fetch_partition) \
+        .groupByKey() \
+        .mapValues(list) \
+        .collectAsMap()
+    failed = sum('error' in part for parts in partitions.values() for part in parts)
+    logger.info(f"📥 Fetched {len(fetch_tasks) - failed}/{len(fetch_tasks)} partitions")
+    shared = sc.broadcast(partitions)
+    
+    slots, task_cpus = executor_slots(sc)
+    try:
+        if DDP_ENABLED and slots > 1:
+            world_size = min(DDP_MAX_RANKS, slots)
+            logger.info(f"   🔗 DDP training on {world_size} ranks")
+            result = run_ddp(sc, world_size,
+                             lambda rank, world_size: train_global_model(shared.value, workspaces, task_cpus, rank, world_size))
+        else:
+            result = sc.parallelize([0], 1) \
+                .map(lambda _: train_global_model(shared.value, workspaces, task_cpus)) \
+                .collect()[0]
+    finally:
+        shared.unpersist()
+    
+    register_model(result)
+    
+    logger.info("=" * 80)
+    if result['status'] == 'success':
+        logger.info(f"✅ Global model: {len(result['workspaces'])} workspaces, {result['sequences']} sequences, "
+                    f"{result['records']} records")
+    elif result['status'] == 'skipped':
+        logger.info(f"⚠️  Global model skipped: {result.get('reason', 'unknown')}")
+    else:
+        logger.info(f"❌ Global model failed: {result.get('error', 'unknown error')}")
+    logger.info("=" * 80)
+    
+    return result
+
 def main():
     """Main function"""
     logger.info("=" * 80)
@@ -436,7 +1335,10 @@ def main():
             return
         
         # Train models using distributed processing (30 days of data)
-        results = train_all_workspaces_distributed(spark, workspaces, hours_back=720)
+        if GLOBAL_TRAINING:
+            results = train_global_distributed(spark, workspaces, hours_back=720)
+        else:
+            results = train_all_workspaces_distributed(spark, workspaces, hours_back=720)
         
         logger.info("🎉 Distributed training complete!")
         
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Batching writer stage for the MQTT to InfluxDB bridge
+Queues line-protocol records and flushes them from a background thread
+by size or time, with retry/backoff and a configurable backpressure policy
+"""
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What submit() does when the queue is full
+BACKPRESSURE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+class BatchingWriter:
+    def __init__(self, write_fn, batch_size=5000, flush_interval=1.0, max_queue_size=100000,
+                 backpressure="block", block_timeout=5.0, max_retries=5, retry_delay=0.5,
+                 max_retry_delay=30.0):
+        """
+        Args:
+            write_fn: Callable taking a list of line-protocol records; raises on failure
+            batch_size: Flush once this many records are pending
+            flush_interval: Flush at least this often (seconds) while records are pending
+            max_queue_size: Records held in memory before backpressure applies
+            backpressure: "block" waits up to block_timeout then drops the record,
+                          "drop_newest" drops the incoming record,
+                          "drop_oldest" evicts the oldest queued record
+            max_retries: Attempts per batch before it is counted as failed
+            retry_delay: First retry delay (seconds), doubled per attempt up to max_retry_delay
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stop_event = threading.Event()
+
+        # Counters (read by the bridge for throughput logging)
+        self.points_written = 0
+        self.points_dropped = 0
+        self.points_failed = 0
+        self.batches_written = 0
+
+        self.worker = threading.Thread(target=self._run, name="influx-batch-writer", daemon=True)
+        self.worker.start()
+
+    def submit(self, record):
+        """Queue one record; returns False if it was dropped by the backpressure policy"""
+        if self.backpressure == "block":
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.points_dropped += 1
+                return False
+
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            if self.backpressure == "drop_newest":
+                self.points_dropped += 1
+                return False
+
+        # drop_oldest: make room by discarding the head of the queue
+        try:
+            self.queue.get_nowait()
+            self.points_dropped += 1
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.points_dropped += 1
+            return False
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def close(self, timeout=30.0):
+        """Stop accepting work, flush what is queued and wait for the worker"""
+        self.stop_event.set()
+        self.worker.join(timeout=timeout)
+
+    def _collect_batch(self):
+        """Block for the first record, then gather until batch_size or flush_interval"""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_with_retry(self, batch):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.write_fn(batch)
+                self.points_written += len(batch)
+                self.batches_written += 1
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Write failed after {attempt} attempts, dropping {len(batch)} points: {e}")
+                    break
+                logger.warning(f"Write failed (attempt {attempt}/{self.max_retries}): {e}. Retrying in {delay:.1f}s")
+                # Wake early on shutdown, but still make the remaining attempts
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+        self.points_failed += len(batch)
+        return False
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._write_with_retry(batch)
+
+
+class ThroughputMeter:
+    """Points/second between successive report() calls"""
+
+    def __init__(self):
+        self.last_time = time.monotonic()
+        self.last_count = 0
+
+    def report(self, count):
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        rate = (count - self.last_count) / elapsed if elapsed > 0 else 0.0
+        self.last_time = now
+        self.last_count = count
+        return rate
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Fast-path line-protocol encoder for sensor payloads
+Produces the same line protocol as the influxdb_client Point builder used by the bridge,
+with the six sensor fields laid out once and tag escaping cached per series
+
+Run directly for a micro-benchmark against the Point path:
+    python3 line_protocol.py [messages]
+"""
+import math
+
+# Field order matches Point, which sorts fields by key
+SENSOR_FIELDS = ("accX", "accY", "accZ", "current", "tempA", "tempB")
+
+_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+
+
+def _escape_tag_value(value):
+    escaped = str(value).translate(_ESCAPE_KEY)
+    if escaped.endswith('\\'):
+        escaped += ' '
+    return escaped
+
+
+def _format_float(value):
+    # Whole numbers drop the trailing ".0", as Point does
+    text = repr(value)
+    return text[:-2] if text.endswith('.0') else text
+
+
+class SensorLineEncoder:
+    def __init__(self, measurement="sensor_data", fields=SENSOR_FIELDS, max_cached_series=100000):
+        self.measurement = measurement.translate(_ESCAPE_MEASUREMENT)
+        self.fields = tuple(sorted(fields))
+        self.field_prefixes = tuple(f"{field.translate(_ESCAPE_KEY)}=" for field in self.fields)
+        self.max_cached_series = max_cached_series
+        self._series_cache = {}  # {(workspace_id, sensor_type): "measurement,tags "}
+
+    def series_prefix(self, workspace_id, sensor_type):
+        """Measurement plus escaped tag set, cached per (workspace_id, sensor_type)"""
+        key = (workspace_id, sensor_type)
+        prefix = self._series_cache.get(key)
+        if prefix is not None:
+            return prefix
+
+        # Tags in key order (sensor_type < workspace_id); None or empty values are omitted like Point does
+        tags = []
+        for tag_key, tag_value in (("sensor_type", sensor_type), ("workspace_id", workspace_id)):
+            if tag_value is None:
+                continue
+            escaped = _escape_tag_value(tag_value)
+            if escaped:
+                tags.append(f"{tag_key}={escaped}")
+        prefix = f"{self.measurement}{',' if tags else ''}{','.join(tags)} "
+
+        if len(self._series_cache) < self.max_cached_series:
+            self._series_cache[key] = prefix
+        return prefix
+
+    def encode_line(self, payload, timestamp_ns=None):
+        """One decoded sensor payload to a line-protocol string.
+
+        Without timestamp_ns the server assigns the write time; spooled records
+        need an explicit timestamp so replay keeps the time they were received.
+        """
+        get = payload.get
+        parts = []
+        for field, prefix in zip(self.fields, self.field_prefixes):
+            value = float(get(field, 0))
+            if math.isfinite(value):
+                parts.append(prefix + _format_float(value))
+        if not parts:
+            return ""
+
+        series = self.series_prefix(get("workspace_id", "unknown"), get("sensor_type", "unknown"))
+        if timestamp_ns is None:
+            return series + ",".join(parts)
+        return f"{series}{','.join(parts)} {timestamp_ns}"
+
+    def encode(self, payload, timestamp_ns=None):
+        return self.encode_line(payload, timestamp_ns).encode("utf-8")
+
+    def encode_batch(self, payloads):
+        """Several payloads as one newline-separated line-protocol body"""
+        lines = [self.encode_line(payload) for payload in payloads]
+        return "\n".join(line for line in lines if line).encode("utf-8")
+
+
+def _point_line(payload):
+    """The bridge's previous Point builder path, for comparison"""
+    from influxdb_client import Point
+
+    point = Point("sensor_data") \
+        .tag("workspace_id", payload.get("workspace_id", "unknown")) \
+        .tag("sensor_type", payload.get("sensor_type", "unknown")) \
+        .field("current", float(payload.get("current", 0))) \
+        .field("accX", float(payload.get("accX", 0))) \
+        .field("accY", float(payload.get("accY", 0))) \
+        .field("accZ", float(payload.get("accZ", 0))) \
+        .field("tempA", float(payload.get("tempA", 0))) \
+        .field("tempB", float(payload.get("tempB", 0)))
+    return point.to_line_protocol().encode("utf-8")
+
+
+def benchmark(messages=100000):
+    import random
+    import time
+
+    workspaces = [f"machine-{i:03d}" for i in range(200)] + ["cnc mill,5=axis"]
+    payloads = [{
+        "workspace_id": random.choice(workspaces),
+        "current": round(random.uniform(5, 20), 2),
+        "accX": round(random.uniform(0, 1), 3),
+        "accY": round(random.uniform(0, 1), 3),
+        "accZ": round(random.uniform(0, 1), 3),
+        "tempA": round(random.uniform(30, 60), 1),
+        "tempB": float(random.randint(30, 60)),
+    } for _ in range(messages)]
+
+    encoder = SensorLineEncoder()
+    mismatches = sum(1 for payload in payloads[:1000] if encoder.encode(payload) != _point_line(payload))
+
+    start = time.perf_counter()
+    for payload in payloads:
+        _point_line(payload)
+    point_seconds = time.perf_counter() - start
+
+    encoder = SensorLineEncoder()
+    start = time.perf_counter()
+    for payload in payloads:
+        encoder.encode(payload)
+    encoder_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoder.encode_batch(payloads)
+    batch_seconds = time.perf_counter() - start
+
+    print("=" * 70)
+    print(f"Line-protocol encoding benchmark ({messages} messages)")
+    print("=" * 70)
+    print(f"Output mismatches vs Point (first 1000): {mismatches}")
+    print(f"Point builder:  {messages / point_seconds:>12,.0f} msgs/s")
+    print(f"Encoder:        {messages / encoder_seconds:>12,.0f} msgs/s  ({point_seconds / encoder_seconds:.1f}x)")
+    print(f"Encoder batch:  {messages / batch_seconds:>12,.0f} msgs/s  ({point_seconds / batch_seconds:.1f}x)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
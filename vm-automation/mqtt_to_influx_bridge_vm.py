@@ -2,15 +2,28 @@
 """
 MQTT to InfluxDB bridge for VM deployment
 Connects to VM MQTT broker and writes to VM InfluxDB
+
+Usage:
+    python3 mqtt_to_influx_bridge_vm.py                # single process
+    python3 mqtt_to_influx_bridge_vm.py --workers 4    # sharded: 4 worker processes on a shared subscription
 """
 import paho.mqtt.client as mqtt
-from influxdb_client import InfluxDBClient, Point
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS
 import json
+import struct
 import time
 import logging
+import argparse
+import multiprocessing
+import signal
+import threading
 from datetime import datetime
 import os
+from batch_writer import BatchingWriter, ThroughputMeter
+from line_protocol import SensorLineEncoder
+from spool import SegmentSpool, SpoolWriter
+from sensor_codec import decode_payload, BINARY_TOPIC_PREFIX
 
 # Create logs directory
 os.makedirs('logs', exist_ok=True)
@@ -18,7 +31,7 @@ os.makedirs('logs', exist_ok=True)
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler('logs/bridge-vm.log'),
         logging.StreamHandler()
@@ -30,6 +43,7 @@ logger = logging.getLogger(__name__)
 MQTT_BROKER = "142.93.220.152"
 MQTT_PORT = 1883
 MQTT_TOPIC = "sensor/data"
+MQTT_BINARY_TOPIC = BINARY_TOPIC_PREFIX + "#"  # compact binary payloads, sensor/bin/<workspace_id>[/<sensor_type>]
 MQTT_USERNAME = "test"
 MQTT_PASSWORD = "test"
 
@@ -42,55 +56,133 @@ INFLUXDB_BUCKET = "New_Sensor"
 RECONNECT_DELAY = 5  # seconds
 MAX_RECONNECT_DELAY = 300  # 5 minutes
 
-# Initialize InfluxDB client
-influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-write_api = influx_client.write_api(write_options=SYNCHRONOUS)
+# Batched write settings
+WRITE_BATCH_SIZE = 5000  # points per flush
+WRITE_FLUSH_INTERVAL = 1.0  # seconds
+WRITE_QUEUE_SIZE = 100000  # points buffered in memory
+WRITE_BACKPRESSURE = "block"  # "block", "drop_newest" or "drop_oldest" when the queue is full
+WRITE_MAX_RETRIES = 5
+
+# Write-ahead spool: every message is appended to disk first and drained to InfluxDB
+# in order, so outages delay writes instead of losing data
+SPOOL_ENABLED = True
+SPOOL_DIR = "spool"
+SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024
+SPOOL_CATCH_UP_RATE = 20000  # max points/s drained while replaying a backlog
+
+# Sharded mode: worker processes join one shared subscription group and the broker
+# load-balances messages between them; each worker has its own writer and spool
+BRIDGE_WORKERS = int(os.getenv("BRIDGE_WORKERS", "1"))
+MQTT_SHARE_GROUP = "bridge"
+WORKER_RESTART_DELAY = 5  # seconds between restarts of a crashed worker
+STATS_INTERVAL = 10  # seconds between throughput log lines
+WORKER_STAT_FIELDS = 3  # messages, points written, points pending
+
+# Per-process state, set up by start_writer() in whichever process runs the bridge
+influx_client = None
+write_api = None
+writer = None
+subscribe_topics = [MQTT_TOPIC, MQTT_BINARY_TOPIC]
+
+def write_batch(records):
+    """Write one batch of line-protocol records (runs on the writer thread)"""
+    write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=records)
+
+def spool_dir_for(worker_id):
+    """Worker 0 keeps the single-process spool so a backlog left before switching modes still drains"""
+    if worker_id == 0:
+        return SPOOL_DIR
+    return os.path.join(SPOOL_DIR, f"worker-{worker_id}")
+
+def start_writer(spool_dir=SPOOL_DIR):
+    """Create this process's InfluxDB client and background writer"""
+    global influx_client, write_api, writer
+    
+    influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
+    write_api = influx_client.write_api(write_options=SYNCHRONOUS)
+    
+    # Writes happen on a background thread so a slow InfluxDB never blocks the MQTT network loop
+    if SPOOL_ENABLED:
+        writer = SpoolWriter(
+            write_batch,
+            SegmentSpool(spool_dir, segment_max_bytes=SPOOL_SEGMENT_BYTES),
+            batch_size=WRITE_BATCH_SIZE,
+            flush_interval=WRITE_FLUSH_INTERVAL,
+            catch_up_rate=SPOOL_CATCH_UP_RATE
+        )
+    else:
+        writer = BatchingWriter(
+            write_batch,
+            batch_size=WRITE_BATCH_SIZE,
+            flush_interval=WRITE_FLUSH_INTERVAL,
+            max_queue_size=WRITE_QUEUE_SIZE,
+            backpressure=WRITE_BACKPRESSURE,
+            max_retries=WRITE_MAX_RETRIES
+        )
+
+throughput = ThroughputMeter()
+encoder = SensorLineEncoder()
 
 # Message counter
 message_count = 0
 last_log_time = time.time()
 
+# Publish -> bridge receive lag for payloads that embed a send timestamp (load-test traffic)
+lag_total_ms = 0.0
+lag_max_ms = 0.0
+lag_count = 0
+
 def on_connect(client, userdata, flags, rc):
     """Callback when connected to MQTT broker"""
     if rc == 0:
         logger.info(f"✓ Connected to VM MQTT at {MQTT_BROKER}:{MQTT_PORT}")
-        client.subscribe(MQTT_TOPIC)
-        logger.info(f"✓ Subscribed to topic: {MQTT_TOPIC}")
+        client.subscribe([(topic, 0) for topic in subscribe_topics])
+        logger.info(f"✓ Subscribed to topics: {', '.join(subscribe_topics)}")
     else:
         logger.error(f"✗ Connection failed with code {rc}")
 
 def on_message(client, userdata, msg):
     """Callback when MQTT message received"""
-    global message_count, last_log_time
+    global message_count, last_log_time, lag_total_ms, lag_max_ms, lag_count
     
     try:
-        # Parse JSON payload
-        payload = json.loads(msg.payload.decode())
+        received_ns = time.time_ns()
+        
+        # Parse JSON or compact binary payload
+        payload = decode_payload(msg.topic, msg.payload)
         
-        # Create InfluxDB point
-        point = Point("sensor_data") \
-            .tag("workspace_id", payload.get("workspace_id", "unknown")) \
-            .tag("sensor_type", payload.get("sensor_type", "unknown")) \
-            .field("current", float(payload.get("current", 0))) \
-            .field("accX", float(payload.get("accX", 0))) \
-            .field("accY", float(payload.get("accY", 0))) \
-            .field("accZ", float(payload.get("accZ", 0))) \
-            .field("tempA", float(payload.get("tempA", 0))) \
-            .field("tempB", float(payload.get("tempB", 0)))
+        sent_ns = payload.get("sent_ns")
+        if sent_ns:
+            lag_ms = (received_ns - sent_ns) / 1e6
+            lag_total_ms += lag_ms
+            lag_max_ms = max(lag_max_ms, lag_ms)
+            lag_count += 1
         
-        # Write to InfluxDB
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
+        # Encode straight to line protocol, stamped with the receive time so
+        # batched or spooled writes keep the time the reading arrived
+        line = encoder.encode(payload, timestamp_ns=received_ns)
+        
+        # Queue for the batched writer (a payload with no finite fields encodes to nothing)
+        if line:
+            writer.submit(line)
         
         message_count += 1
         
         # Log every 10 seconds
         current_time = time.time()
         if current_time - last_log_time >= 10:
-            logger.info(f"[{message_count} msgs] Latest: {payload.get('workspace_id')} | current={payload.get('current')}")
+            points_per_second = throughput.report(writer.points_written)
+            lag = f" | receive lag avg {lag_total_ms / lag_count:.1f} ms, max {lag_max_ms:.1f} ms" if lag_count else ""
+            logger.info(f"[{message_count} msgs] Latest: {payload.get('workspace_id')} | current={payload.get('current')} | "
+                        f"{points_per_second:.0f} pts/s written, {writer.pending()} queued, "
+                        f"{writer.points_dropped} dropped, {writer.points_failed} failed{lag}")
             last_log_time = current_time
+            lag_total_ms, lag_max_ms, lag_count = 0.0, 0.0, 0
         
     except json.JSONDecodeError as e:
         logger.error(f"JSON error: {e}")
+    except struct.error as e:
+        logger.error(f"Binary payload error on {msg.topic}: {e}")
     except Exception as e:
         logger.error(f"Processing error: {e}")
 
@@ -101,19 +193,12 @@ def on_disconnect(client, userdata, rc):
     else:
         logger.info("Disconnected from MQTT")
 
-def main():
-    """Main function"""
-    print("=" * 70)
-    print("MQTT→InfluxDB Bridge for VM")
-    print("=" * 70)
-    print(f"MQTT:     {MQTT_BROKER}:{MQTT_PORT}")
-    print(f"Topic:    {MQTT_TOPIC}")
-    print(f"InfluxDB: {INFLUXDB_URL}")
-    print(f"Bucket:   {INFLUXDB_BUCKET}")
-    print("=" * 70)
+def run_bridge(client_id="vm_bridge_pc", spool_dir=SPOOL_DIR):
+    """Run one bridge process until interrupted"""
+    start_writer(spool_dir)
     
     # Setup MQTT client
-    client = mqtt.Client(client_id="vm_bridge_pc")
+    client = mqtt.Client(client_id=client_id)
     client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     client.on_connect = on_connect
     client.on_message = on_message
@@ -140,25 +225,131 @@ def main():
                 time.sleep(RECONNECT_DELAY)
             else:
                 logger.error("Max retries reached. Exiting.")
+                writer.close()
                 influx_client.close()
                 return
     
     logger.info("Bridge running! Press Ctrl+C to stop.")
-    print("=" * 70)
     
     try:
         client.loop_forever(retry_first_connection=True)
     except KeyboardInterrupt:
-        print("\n" + "=" * 70)
         logger.info("Shutting down...")
     except Exception as e:
         logger.error(f"Error: {e}")
     finally:
         client.disconnect()
+        logger.info(f"Stopping writer with {writer.pending()} points pending...")
+        writer.close()
         influx_client.close()
         logger.info(f"Total messages: {message_count}")
+        logger.info(f"Points written: {writer.points_written}, dropped: {writer.points_dropped}, failed: {writer.points_failed}")
         logger.info("Bridge stopped")
-        print("=" * 70)
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_worker(worker_id, stats):
+    """Sharded worker process: shared subscription, own writer and spool, counters published to stats"""
+    global subscribe_topics
+    subscribe_topics = [f"$share/{MQTT_SHARE_GROUP}/{topic}" for topic in subscribe_topics]
+    
+    # The supervisor stops workers with SIGTERM; shut down like Ctrl+C so the writer is closed cleanly
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    
+    def publish_stats():
+        offset = worker_id * WORKER_STAT_FIELDS
+        while True:
+            if writer is not None:
+                stats[offset] = message_count
+                stats[offset + 1] = writer.points_written
+                stats[offset + 2] = writer.pending()
+            time.sleep(1)
+    
+    threading.Thread(target=publish_stats, name="stats", daemon=True).start()
+    run_bridge(client_id=f"vm_bridge_pc_{worker_id}", spool_dir=spool_dir_for(worker_id))
+
+def run_supervisor(num_workers):
+    """Start worker processes, restart any that exit, and log their combined throughput"""
+    stats = multiprocessing.Array('q', num_workers * WORKER_STAT_FIELDS, lock=False)
+    retired = [0, 0]  # messages and points counted by workers that have since been restarted
+    processes = {}
+    next_start = {worker_id: 0.0 for worker_id in range(num_workers)}
+    meter = ThroughputMeter()
+    last_stats_time = time.time()
+    
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    
+    try:
+        while True:
+            now = time.time()
+            
+            for worker_id in range(num_workers):
+                process = processes.get(worker_id)
+                if process is not None and process.is_alive():
+                    continue
+                
+                if process is not None:
+                    logger.warning(f"Worker {worker_id} exited (code {process.exitcode}), restarting in {WORKER_RESTART_DELAY}s")
+                    offset = worker_id * WORKER_STAT_FIELDS
+                    retired[0] += stats[offset]
+                    retired[1] += stats[offset + 1]
+                    stats[offset:offset + WORKER_STAT_FIELDS] = [0] * WORKER_STAT_FIELDS
+                    processes[worker_id] = None
+                    next_start[worker_id] = now + WORKER_RESTART_DELAY
+                    continue
+                
+                if now >= next_start[worker_id]:
+                    process = multiprocessing.Process(target=run_worker, args=(worker_id, stats), name=f"bridge-worker-{worker_id}")
+                    process.start()
+                    processes[worker_id] = process
+                    logger.info(f"Started worker {worker_id} (pid {process.pid})")
+            
+            if now - last_stats_time >= STATS_INTERVAL:
+                messages = retired[0] + sum(stats[i] for i in range(0, len(stats), WORKER_STAT_FIELDS))
+                written = retired[1] + sum(stats[i] for i in range(1, len(stats), WORKER_STAT_FIELDS))
+                pending = sum(stats[i] for i in range(2, len(stats), WORKER_STAT_FIELDS))
+                alive = sum(1 for process in processes.values() if process is not None and process.is_alive())
+                logger.info(f"[{alive}/{num_workers} workers] {messages} msgs | "
+                            f"{meter.report(written):.0f} pts/s written, {pending} pending")
+                last_stats_time = now
+            
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        for process in processes.values():
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            if process is not None:
+                process.join(timeout=60)
+        logger.info("Supervisor stopped")
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="MQTT to InfluxDB bridge")
+    parser.add_argument("--workers", type=int, default=BRIDGE_WORKERS,
+                        help="Worker processes sharing the subscription (1 = single process)")
+    args = parser.parse_args()
+    
+    print("=" * 70)
+    print("MQTT→InfluxDB Bridge for VM")
+    print("=" * 70)
+    print(f"MQTT:     {MQTT_BROKER}:{MQTT_PORT}")
+    print(f"Topics:   {MQTT_TOPIC} (JSON), {MQTT_BINARY_TOPIC} (binary)")
+    print(f"InfluxDB: {INFLUXDB_URL}")
+    print(f"Bucket:   {INFLUXDB_BUCKET}")
+    if args.workers > 1:
+        print(f"Workers:  {args.workers} (shared subscription group $share/{MQTT_SHARE_GROUP}/)")
+    print("=" * 70)
+    
+    if args.workers > 1:
+        run_supervisor(args.workers)
+    else:
+        run_bridge()
+    
+    print("=" * 70)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Sensor payload codec shared by GenerateData.py and the MQTT to InfluxDB bridge
+
+Two wire formats are accepted:
+- JSON on MQTT_TOPIC ("sensor/data"), as before
+- Compact binary on "sensor/bin/<workspace_id>[/<sensor_type>]": the workspace id and optional
+  sensor type travel in the topic, percent-encoded so '/', '+' and '#' can't break the topic levels;
+  the payload is a fixed 33-byte struct:
+      header byte 0xB1 | uint64 send time (ns since epoch) | 6 x float32 (current, accX, accY, accZ, tempA, tempB)
+The header byte also identifies binary payloads on any topic (JSON always starts with '{').
+"""
+import json
+import struct
+import time
+from urllib.parse import quote, unquote
+
+BINARY_HEADER = 0xB1
+BINARY_STRUCT = struct.Struct("<BQ6f")
+BINARY_TOPIC_PREFIX = "sensor/bin/"
+BINARY_FIELDS = ("current", "accX", "accY", "accZ", "tempA", "tempB")
+
+
+def binary_topic(workspace_id, sensor_type=None):
+    """Topic for a workspace's binary payloads; sensor_type is carried as an extra level when given"""
+    if not workspace_id:
+        raise ValueError("workspace_id must be a non-empty string")
+    topic = BINARY_TOPIC_PREFIX + quote(workspace_id, safe="")
+    if sensor_type:
+        topic += "/" + quote(sensor_type, safe="")
+    return topic
+
+
+def encode_binary(data, sent_ns=None):
+    """Pack a sensor reading dict into the binary format (workspace_id goes in the topic)"""
+    return BINARY_STRUCT.pack(
+        BINARY_HEADER,
+        time.time_ns() if sent_ns is None else sent_ns,
+        float(data.get("current", 0)),
+        float(data.get("accX", 0)),
+        float(data.get("accY", 0)),
+        float(data.get("accZ", 0)),
+        float(data.get("tempA", 0)),
+        float(data.get("tempB", 0))
+    )
+
+
+def decode_binary(topic, raw):
+    header, sent_ns, current, acc_x, acc_y, acc_z, temp_a, temp_b = BINARY_STRUCT.unpack(raw)
+    workspace_id, sensor_type = "unknown", None
+    if topic.startswith(BINARY_TOPIC_PREFIX):
+        levels = topic[len(BINARY_TOPIC_PREFIX):].split("/")
+        workspace_id = unquote(levels[0]) or "unknown"
+        if len(levels) > 1 and levels[1]:
+            sensor_type = unquote(levels[1])
+    # float32 carries ~7 significant digits; round so 0.15 is stored as 0.15, not 0.15000000596
+    reading = {
+        "workspace_id": workspace_id,
+        "sent_ns": sent_ns,
+        "current": float("%.7g" % current),
+        "accX": float("%.7g" % acc_x),
+        "accY": float("%.7g" % acc_y),
+        "accZ": float("%.7g" % acc_z),
+        "tempA": float("%.7g" % temp_a),
+        "tempB": float("%.7g" % temp_b),
+    }
+    # Without a sensor type level the bridge tags "unknown", as for JSON without the key
+    if sensor_type is not None:
+        reading["sensor_type"] = sensor_type
+    return reading
+
+
+def decode_payload(topic, raw):
+    """Decode either wire format into the sensor reading dict the bridge encodes"""
+    if raw[:1] == b"\xb1":
+        return decode_binary(topic, raw)
+    return json.loads(raw.decode())
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Write-ahead spool for the MQTT to InfluxDB bridge
+Line-protocol records are appended to on-disk segment files before they are written
+to InfluxDB, and drained asynchronously in order. A small index file records the
+committed (written) position, so after a crash or an InfluxDB outage the drainer
+resumes exactly where it stopped, at a capped catch-up rate.
+
+Layout of the spool directory:
+    segment_0000000001.log   newline-separated line-protocol records
+    segment_0000000002.log   (a new segment starts once the active one reaches segment_max_bytes)
+    committed.idx            {"segment": <seq>, "offset": <byte offset>} of the next record to drain
+    quarantine.log           records InfluxDB permanently rejected, each batch after a "# <time> <error>" comment
+"""
+import os
+import re
+import json
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^segment_(\d{10})\.log$")
+INDEX_FILE = "committed.idx"
+QUARANTINE_FILE = "quarantine.log"
+
+
+# Rejections of the records themselves (bad line protocol, too large, field type conflict).
+# Everything else is retried: connection errors, 5xx, rate limiting, and auth or
+# missing-bucket errors (401/403/404), which are configuration outages, not bad data
+CONTENT_ERROR_STATUSES = (400, 413, 422)
+CONFIG_ERROR_STATUSES = (401, 403, 404)
+
+
+def is_permanent_error(error):
+    """True for write errors a retry can't fix because InfluxDB rejected the records' content"""
+    return getattr(error, "status", None) in CONTENT_ERROR_STATUSES
+
+
+class SegmentSpool:
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024, fsync_interval=1.0):
+        """
+        Args:
+            directory: Spool directory (created if missing)
+            segment_max_bytes: Roll over to a new segment file after this size
+            fsync_interval: Seconds between fsyncs of the active segment (bounds loss on power failure)
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self._list_segments()
+        self.committed = self._read_index(segments)
+
+        # Append side: the newest segment, with any torn record from a crash cut off
+        self.active_seq = segments[-1] if segments else self.committed[0]
+        self._truncate_partial_record(self.active_seq)
+        self.active_file = open(self._segment_path(self.active_seq), "ab")
+        self.last_sync = time.monotonic()
+
+        # Read side starts at the committed position
+        self.read_seq, self.read_offset = self.committed
+        self.read_file = None
+
+        self.backlog = self._count_records_from(self.committed)
+        if self.backlog:
+            logger.info(f"Spool has {self.backlog} uncommitted records to replay")
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"segment_{seq:010d}.log")
+
+    def _list_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    def _read_index(self, segments):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            return index["segment"], index["offset"]
+        except FileNotFoundError:
+            return (segments[0] if segments else 1), 0
+
+    def _write_index(self, seq, offset):
+        # Write-then-rename so a crash never leaves a half-written index
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": seq, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+
+    def _truncate_partial_record(self, seq):
+        path = self._segment_path(seq)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            # Records are short, so the last newline is always within the tail
+            tail_start = max(0, size - 64 * 1024)
+            f.seek(tail_start)
+            tail = f.read()
+            end = tail_start + tail.rfind(b"\n") + 1
+            if end != size:
+                logger.warning(f"Dropping {size - end} bytes of a torn record in {os.path.basename(path)}")
+                f.truncate(end)
+
+    def _count_records_from(self, position):
+        seq, offset = position
+        count = 0
+        for segment_seq in self._list_segments():
+            if segment_seq < seq:
+                continue
+            with open(self._segment_path(segment_seq), "rb") as f:
+                if segment_seq == seq:
+                    f.seek(offset)
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    count += chunk.count(b"\n")
+        return count
+
+    def append(self, record):
+        """Append one record (bytes without newline); durable within fsync_interval"""
+        with self.lock:
+            self.active_file.write(record + b"\n")
+            self.backlog += 1
+
+            now = time.monotonic()
+            if now - self.last_sync >= self.fsync_interval:
+                self.active_file.flush()
+                os.fsync(self.active_file.fileno())
+                self.last_sync = now
+
+            if self.active_file.tell() >= self.segment_max_bytes:
+                self.active_file.flush()
+                os.fsync(self.active_file.fileno())
+                self.active_file.close()
+                self.active_seq += 1
+                self.active_file = open(self._segment_path(self.active_seq), "ab")
+
+    def read_batch(self, max_records):
+        """Read up to max_records after the read cursor; returns (records, position after them)"""
+        with self.lock:
+            # Make appended records visible to the reader's file handle
+            self.active_file.flush()
+            active_seq = self.active_seq
+
+        records = []
+        while len(records) < max_records:
+            if self.read_file is None:
+                path = self._segment_path(self.read_seq)
+                if not os.path.exists(path):
+                    if self.read_seq < active_seq:
+                        self.read_seq += 1
+                        self.read_offset = 0
+                        continue
+                    break
+                self.read_file = open(path, "rb")
+                self.read_file.seek(self.read_offset)
+
+            line = self.read_file.readline()
+            if line.endswith(b"\n"):
+                records.append(line[:-1])
+                self.read_offset += len(line)
+                continue
+
+            # End of this segment: move on only once the appender has rolled past it
+            self.read_file.seek(self.read_offset)
+            if self.read_seq < active_seq:
+                self.read_file.close()
+                self.read_file = None
+                self.read_seq += 1
+                self.read_offset = 0
+                continue
+            break
+
+        return records, (self.read_seq, self.read_offset)
+
+    def rewind(self):
+        """Move the read cursor back to the committed position (after a failed write)"""
+        if self.read_file is not None:
+            self.read_file.close()
+            self.read_file = None
+        self.read_seq, self.read_offset = self.committed
+
+    def commit(self, position, count):
+        """Mark everything before position as written and delete fully drained segments"""
+        self._write_index(*position)
+        self.committed = position
+        with self.lock:
+            self.backlog -= count
+
+        for seq in self._list_segments():
+            if seq < position[0]:
+                os.remove(self._segment_path(seq))
+
+    def close(self):
+        with self.lock:
+            self.active_file.flush()
+            os.fsync(self.active_file.fileno())
+            self.active_file.close()
+        if self.read_file is not None:
+            self.read_file.close()
+
+
+class SpoolWriter:
+    """Drop-in replacement for BatchingWriter that writes ahead to a SegmentSpool.
+
+    submit() only appends to disk; a background thread drains the spool in order,
+    retrying failed batches indefinitely, so nothing is dropped while InfluxDB is down.
+    Records whose content InfluxDB rejects (400/413/422) are split out of their batch, moved
+    to the spool's quarantine file and committed past, so one bad record can't stall ingest.
+    """
+
+    def __init__(self, write_fn, spool, batch_size=5000, flush_interval=1.0, catch_up_rate=20000,
+                 retry_delay=0.5, max_retry_delay=30.0):
+        """
+        Args:
+            write_fn: Callable taking a list of line-protocol records; raises on failure
+            spool: SegmentSpool to write ahead to
+            batch_size: Records per InfluxDB write
+            flush_interval: Seconds to wait for more records before writing a partial batch
+            catch_up_rate: Max points/second drained, so replaying a backlog doesn't swamp InfluxDB
+            retry_delay: First retry delay (seconds), doubled per attempt up to max_retry_delay
+        """
+        self.write_fn = write_fn
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.catch_up_rate = catch_up_rate
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.stop_event = threading.Event()
+
+        # Same counters as BatchingWriter; nothing is dropped here, and failed counts quarantined records
+        self.points_written = 0
+        self.points_dropped = 0
+        self.points_failed = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+        self.worker = threading.Thread(target=self._run, name="influx-spool-drainer", daemon=True)
+        self.worker.start()
+
+    def submit(self, record):
+        self.spool.append(record)
+        return True
+
+    def pending(self):
+        return self.spool.backlog
+
+    def close(self, timeout=30.0):
+        """Stop draining (whatever is left stays spooled for the next start) and close the spool"""
+        self.stop_event.set()
+        self.worker.join(timeout=timeout)
+        self.spool.close()
+
+    def _write_until_success(self, records):
+        """Retry transient failures until written (True) or stopped (False); permanent errors are raised"""
+        delay = self.retry_delay
+        while True:
+            try:
+                self.write_fn(records)
+                return True
+            except Exception as e:
+                self.write_errors += 1
+                if is_permanent_error(e):
+                    raise
+                if getattr(e, "status", None) in CONFIG_ERROR_STATUSES:
+                    logger.error(f"InfluxDB refused the write ({e.status}), check the token, org and bucket. "
+                                 f"{len(records)} points stay spooled, retrying in {delay:.1f}s")
+                else:
+                    logger.warning(f"Write failed, {len(records)} points stay spooled: {e}. Retrying in {delay:.1f}s")
+                if self.stop_event.wait(delay):
+                    return False
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _write_batch(self, records):
+        """Write records, bisecting a permanently rejected batch down to the records InfluxDB refuses"""
+        try:
+            return self._write_until_success(records)
+        except Exception as e:
+            if len(records) == 1:
+                self._quarantine(records, e)
+                return True
+            # Points InfluxDB accepted from a partial write are simply overwritten by the retry
+            middle = len(records) // 2
+            return self._write_batch(records[:middle]) and self._write_batch(records[middle:])
+
+    def _quarantine(self, records, error):
+        path = os.path.join(self.spool.directory, QUARANTINE_FILE)
+        reason = " ".join(str(error).split())
+        with open(path, "ab") as f:
+            f.write(f"# {time.strftime('%Y-%m-%dT%H:%M:%S')} {reason}\n".encode())
+            f.write(b"".join(record + b"\n" for record in records))
+        self.points_failed += len(records)
+        logger.error(f"InfluxDB rejected {len(records)} point(s), moved to {path}: {reason}")
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            records, position = self.spool.read_batch(self.batch_size)
+
+            if not records:
+                self.stop_event.wait(self.flush_interval)
+                continue
+
+            # Top up a small batch for a moment rather than issuing many tiny writes
+            if len(records) < self.batch_size:
+                self.stop_event.wait(self.flush_interval)
+                more, position = self.spool.read_batch(self.batch_size - len(records))
+                records.extend(more)
+
+            failed_before = self.points_failed
+            if not self._write_batch(records):
+                self.spool.rewind()
+                break
+
+            self.spool.commit(position, len(records))
+            self.points_written += len(records) - (self.points_failed - failed_before)
+            self.batches_written += 1
+
+            # Cap the drain rate during catch-up
+            if self.catch_up_rate:
+                min_seconds = len(records) / self.catch_up_rate
+                elapsed = time.monotonic() - started
+                if elapsed < min_seconds:
+                    self.stop_event.wait(min_seconds - elapsed)